@@ -0,0 +1,173 @@
+from datetime import date, datetime
+from typing import Optional
+from sqlalchemy import case, exists, func, select as sa_select, union_all, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select, delete
+from database import engines, create_db_and_tables
+from models import Attendance, MemberActivity, Subscription, User
+from cohorts import month_index
+from scheduling import to_local
+import archive
+
+REBUILD_CHUNK_SIZE = 5000
+TOP_N = 10
+EPOCH = date(1970, 1, 1)
+
+
+def week_index(local: datetime) -> int:
+    # 1970-01-01 was a Thursday; shift so weeks start on Monday
+    return ((local.date() - EPOCH).days + 3) // 7
+
+
+def ensure_member(session: Session, user_id: int):
+    # Every member has a counters row from the start, so "least active" can read it off an index
+    session.execute(
+        sqlite_insert(MemberActivity.__table__).values(user_id=user_id).on_conflict_do_nothing()
+    )
+
+
+def record_visit(session: Session, user_id: int, check_in_time: datetime):
+    # One UPDATE in the check-in transaction; every SET expression sees the row as it was before
+    local = to_local(check_in_time)
+    week, month = week_index(local), month_index(local)
+    ensure_member(session, user_id)
+    streak = case(
+        (MemberActivity.week == week, MemberActivity.current_streak),
+        (MemberActivity.week == week - 1, MemberActivity.current_streak + 1),
+        else_=1,
+    )
+    session.execute(
+        update(MemberActivity)
+        .where(MemberActivity.user_id == user_id)
+        .values(
+            total_visits=MemberActivity.total_visits + 1,
+            current_streak=streak,
+            longest_streak=func.max(MemberActivity.longest_streak, streak),
+            week=week,
+            week_visits=case((MemberActivity.week == week, MemberActivity.week_visits + 1), else_=1),
+            month=month,
+            month_visits=case((MemberActivity.month == month, MemberActivity.month_visits + 1), else_=1),
+            last_check_in=check_in_time,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _apply_visit(member: MemberActivity, check_in_time: datetime):
+    # Same rules as record_visit, for replaying history in memory
+    local = to_local(check_in_time)
+    week, month = week_index(local), month_index(local)
+    if member.week != week:
+        member.current_streak = member.current_streak + 1 if member.week == week - 1 else 1
+        member.week = week
+        member.week_visits = 0
+    if member.month != month:
+        member.month = month
+        member.month_visits = 0
+    member.total_visits += 1
+    member.week_visits += 1
+    member.month_visits += 1
+    member.longest_streak = max(member.longest_streak, member.current_streak)
+    member.last_check_in = check_in_time
+
+
+def stats_for(session: Session, user_id: int, now: Optional[datetime] = None) -> dict:
+    # O(1) read; week/month counts and the streak are stored as of the last visit, so age them here
+    member = session.get(MemberActivity, user_id) or MemberActivity(user_id=user_id)
+    local = to_local(now or datetime.utcnow())
+    week, month = week_index(local), month_index(local)
+    return {
+        "total_visits": member.total_visits,
+        # The current week may still be in progress; a whole week without visits ends the streak
+        "current_streak": member.current_streak if member.week >= week - 1 else 0,
+        "longest_streak": member.longest_streak,
+        "week_visits": member.week_visits if member.week == week else 0,
+        "month_visits": member.month_visits if member.month == month else 0,
+        "last_check_in": member.last_check_in,
+    }
+
+
+def most_active(session: Session, limit: int = TOP_N, now: Optional[datetime] = None) -> list:
+    # Reads the top of ix_memberactivity_month_visits for the current month
+    month = month_index(to_local(now or datetime.utcnow()))
+    return session.exec(
+        select(User, MemberActivity.month_visits)
+        .join(MemberActivity, MemberActivity.user_id == User.id)
+        .where(MemberActivity.month == month)
+        .order_by(MemberActivity.month_visits.desc())
+        .limit(limit)
+    ).all()
+
+
+def least_active(session: Session, limit: int = TOP_N, now: Optional[datetime] = None) -> list:
+    # Walks ix_memberactivity_last_check_in from the oldest visit (SQLite sorts NULL, never
+    # checked in, first) and stops after `limit` members with a current membership
+    now = now or datetime.utcnow()
+    return session.exec(
+        select(User, MemberActivity.last_check_in)
+        .select_from(MemberActivity)
+        .join(User, User.id == MemberActivity.user_id)
+        .where(
+            exists().where(Subscription.user_id == MemberActivity.user_id, Subscription.end_date > now)
+        )
+        .order_by(MemberActivity.last_check_in, MemberActivity.user_id)
+        .limit(limit)
+    ).all()
+
+
+def rebuild(session: Session) -> int:
+    # Repair: replay every check-in, hot and archived, in one ordered pass
+    session.exec(delete(MemberActivity))
+    query = sa_select(archive.hot_attendance.c.user_id, archive.hot_attendance.c.check_in_time)
+    if archive.archived_before(session) is not None:
+        query = union_all(
+            query, sa_select(archive.cold_attendance.c.user_id, archive.cold_attendance.c.check_in_time)
+        )
+    history = query.subquery()
+    rows = session.execute(
+        sa_select(history.c.user_id, history.c.check_in_time)
+        .order_by(history.c.user_id, history.c.check_in_time)
+        .execution_options(yield_per=REBUILD_CHUNK_SIZE)
+    )
+
+    members = {}
+    for user_id, check_in_time in rows:
+        member = members.get(user_id)
+        if member is None:
+            member = members[user_id] = MemberActivity(user_id=user_id)
+        _apply_visit(member, check_in_time)
+
+    session.add_all(members.values())
+    session.flush()
+    _add_missing_members(session)
+    session.commit()
+    return len(members)
+
+
+def _add_missing_members(session: Session):
+    # Members without a single check-in get an empty row
+    session.execute(
+        sqlite_insert(MemberActivity.__table__).from_select(
+            ["user_id"], sa_select(User.id).where(User.id.not_in(sa_select(MemberActivity.user_id)))
+        )
+    )
+
+
+def ensure_built(session: Session):
+    # First start after upgrading: derive the counters from existing history
+    if session.exec(select(MemberActivity.user_id).limit(1)).first() is None:
+        has_history = session.exec(select(Attendance.id).limit(1)).first() is not None
+        if has_history or archive.archived_before(session) is not None:
+            rebuild(session)
+            return
+    # Counters created before every member had a row
+    _add_missing_members(session)
+    session.commit()
+
+
+if __name__ == "__main__":
+    create_db_and_tables()
+    archive.ensure_schema()
+    for slug, engine in engines.items():
+        with Session(engine) as session:
+            print(f"{slug}: rebuilt activity counters for {rebuild(session)} member(s)")
@@ -0,0 +1,156 @@
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+import numpy as np
+from sqlmodel import Session
+from scheduling import from_local
+import archive
+
+SECONDS_PER_DAY = 86400
+HOURS_PER_WEEK = 7 * 24
+WEEKDAY_LABELS = ["Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom"]
+
+# Results per (database, start, end, window); bounded so odd ranges from the API can't grow it forever
+_CACHE_MAX_ENTRIES = 32
+_cache: "OrderedDict[tuple, dict]" = OrderedDict()
+
+
+def invalidate_cache(since: Optional[date] = None):
+    # Drop reports whose range reaches `since` (all of them when omitted); closed past ranges stay cached
+    if since is None:
+        _cache.clear()
+        return
+    for key in [k for k in _cache if k[2] >= since]:
+        del _cache[key]
+
+
+def _utc_offset_seconds(utc_seconds: int) -> int:
+    # Check-ins are stored in UTC; staff think in the server's local wall clock
+    offset = datetime.fromtimestamp(utc_seconds, timezone.utc).astimezone().utcoffset()
+    return int(offset.total_seconds()) if offset else 0
+
+
+def offset_transitions(start: int, end: int) -> tuple:
+    # The local zone's UTC offsets over [start, end] as (first UTC second of each, offset) arrays.
+    # Offsets change at most a few times a year: sample daily and bisect each change to the second.
+    starts, offsets = [start], [_utc_offset_seconds(start)]
+    previous = start
+    while previous < end:
+        sample = min(previous + SECONDS_PER_DAY, end)
+        offset = _utc_offset_seconds(sample)
+        if offset != offsets[-1]:
+            low, high = previous, sample
+            while high - low > 1:
+                middle = (low + high) // 2
+                if _utc_offset_seconds(middle) == offsets[-1]:
+                    low = middle
+                else:
+                    high = middle
+            starts.append(high)
+            offsets.append(offset)
+        previous = sample
+    return np.array(starts, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+
+def load_checkins(session: Session, start: date, end: date) -> np.ndarray:
+    # Local epoch seconds (int64) for every check-in in [start, end], each shifted by the
+    # offset in force at that moment so ranges spanning a DST change stay on the wall clock
+    range_start = from_local(datetime.combine(start, datetime.min.time()))
+    range_end = from_local(datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    rows = archive.checkin_times(session, range_start, range_end)
+    if not rows:
+        return np.empty(0, dtype=np.int64)
+    stamps = np.array(rows, dtype="datetime64[s]").astype(np.int64)
+    starts, offsets = offset_transitions(int(stamps.min()), int(stamps.max()))
+    return stamps + offsets[np.searchsorted(starts, stamps, side="right") - 1]
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    # Trailing mean; the first window-1 points average over what is available
+    if values.size == 0:
+        return values.astype(float)
+    window = max(1, min(window, values.size))
+    csum = np.cumsum(values, dtype=float)
+    shifted = np.concatenate((np.zeros(window), csum[:-window]))
+    counts = np.minimum(np.arange(1, values.size + 1), window)
+    return (csum - shifted) / counts
+
+
+def find_peaks(profile: np.ndarray, limit: int = 3) -> np.ndarray:
+    # Local maxima above the mean, strongest first (profile is circular: 23h wraps to 0h)
+    if profile.size == 0 or not profile.any():
+        return np.empty(0, dtype=np.int64)
+    left = np.roll(profile, 1)
+    right = np.roll(profile, -1)
+    mask = (profile > left) & (profile >= right) & (profile > profile.mean())
+    candidates = np.flatnonzero(mask)
+    order = np.argsort(profile[candidates], kind="stable")[::-1]
+    return candidates[order][:limit]
+
+
+def compute_occupancy(stamps: np.ndarray, start: date, end: date, window: int = 7) -> dict:
+    n_days = (end - start).days + 1
+    epoch_day = (start - date(1970, 1, 1)).days
+
+    days = stamps // SECONDS_PER_DAY
+    # 1970-01-01 was a Thursday; shift so Monday == 0
+    weekday = (days + 3) % 7
+    hour = (stamps % SECONDS_PER_DAY) // 3600
+
+    heatmap = np.bincount(weekday * 24 + hour, minlength=HOURS_PER_WEEK).reshape(7, 24)
+    daily = np.bincount(days - epoch_day, minlength=n_days)[:n_days]
+
+    # Average check-ins per hour-of-day, normalised by how many of each weekday the range covers
+    range_weekdays = (np.arange(epoch_day, epoch_day + n_days) + 3) % 7
+    weekday_occurrences = np.bincount(range_weekdays, minlength=7)
+    heatmap_avg = np.divide(
+        heatmap,
+        weekday_occurrences[:, None],
+        out=np.zeros(heatmap.shape, dtype=float),
+        where=weekday_occurrences[:, None] > 0,
+    )
+    hourly_avg = heatmap.sum(axis=0) / n_days
+
+    peaks = find_peaks(hourly_avg)
+    busiest_day = int(np.argmax(daily)) if daily.any() else None
+
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "total_checkins": int(stamps.size),
+        "weekdays": WEEKDAY_LABELS,
+        "heatmap": heatmap.tolist(),
+        "heatmap_avg": np.round(heatmap_avg, 2).tolist(),
+        "hourly_avg": np.round(hourly_avg, 2).tolist(),
+        "daily": {
+            "labels": [(start + timedelta(days=i)).isoformat() for i in range(n_days)],
+            "counts": daily.tolist(),
+            "rolling_avg": np.round(rolling_mean(daily, window), 2).tolist(),
+            "window": window,
+        },
+        "peak_hours": [
+            {"hour": int(h), "avg_checkins": round(float(hourly_avg[h]), 2)} for h in peaks
+        ],
+        "busiest_day": (start + timedelta(days=busiest_day)).isoformat() if busiest_day is not None else None,
+    }
+
+
+def occupancy_report(session: Session, start: date, end: date, window: int = 7) -> dict:
+    # Each branch shard has its own database, so the bound file is part of the key
+    key = (str(session.get_bind().url), start, end, window)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    report = compute_occupancy(load_checkins(session, start, end), start, end, window)
+    _cache[key] = report
+    if len(_cache) > _CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+    return report
+
+
+def peak_hour(session: Session, days: int = 28) -> Optional[int]:
+    end = date.today()
+    report = occupancy_report(session, end - timedelta(days=days - 1), end)
+    peaks = report["peak_hours"]
+    return peaks[0]["hour"] if peaks else None
@@ -0,0 +1,185 @@
+import asyncio
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, and_, func, literal, select as sa_select, text, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+from database import engines, create_db_and_tables
+from models import Attendance, AttendanceMonthly, ArchiveState
+from cohorts import month_index
+
+# Check-ins newer than this stay in the hot table; archival moves whole months only
+ATTENDANCE_HOT_DAYS = int(os.getenv("ATTENDANCE_HOT_DAYS", 180))
+ARCHIVE_INTERVAL_HOURS = int(os.getenv("ARCHIVE_INTERVAL_HOURS", 24))
+
+hot_attendance = Attendance.__table__
+archive_metadata = MetaData(schema="archive")
+# Same columns as the hot table; no foreign key since SQLite can't reference across attached files
+cold_attendance = Table(
+    "attendance",
+    archive_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, nullable=False, index=True),
+    Column("check_in_time", DateTime, nullable=False, index=True),
+)
+monthly = AttendanceMonthly.__table__
+
+# Held while a month moves from the hot file to the archive file. Backups hold it for the whole
+# snapshot so both files are copied on the same side of every move.
+move_lock = threading.Lock()
+
+
+def _reserve_archived_ids(connection):
+    # New check-ins must never reuse an id already in the archive, or the next archival run
+    # fails on the cold primary key. Rows that already collided (written before the hot table
+    # was AUTOINCREMENT) get fresh ids, then the sequence is moved past every archived id.
+    last_id = max(
+        connection.execute(sa_select(func.max(hot_attendance.c.id))).scalar() or 0,
+        connection.execute(sa_select(func.max(cold_attendance.c.id))).scalar() or 0,
+    )
+    collisions = connection.execute(
+        sa_select(hot_attendance.c.id).where(hot_attendance.c.id.in_(sa_select(cold_attendance.c.id)))
+    ).scalars().all()
+    for old_id in collisions:
+        last_id += 1
+        connection.execute(hot_attendance.update().where(hot_attendance.c.id == old_id).values(id=last_id))
+    connection.execute(text(
+        "INSERT INTO main.sqlite_sequence (name, seq) SELECT 'attendance', 0 "
+        "WHERE NOT EXISTS (SELECT 1 FROM main.sqlite_sequence WHERE name = 'attendance')"
+    ))
+    connection.execute(
+        text("UPDATE main.sqlite_sequence SET seq = MAX(seq, :last_id) WHERE name = 'attendance'"),
+        {"last_id": last_id},
+    )
+
+
+def ensure_schema():
+    for engine in engines.values():
+        archive_metadata.create_all(engine)
+        with engine.begin() as connection:
+            _reserve_archived_ids(connection)
+
+
+def _month_start(dt: datetime) -> datetime:
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(dt: datetime) -> datetime:
+    return (dt.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def archive_cutoff(now: Optional[datetime] = None) -> datetime:
+    return _month_start((now or datetime.utcnow()) - timedelta(days=ATTENDANCE_HOT_DAYS))
+
+
+def archived_before(session: Session) -> Optional[datetime]:
+    state = session.get(ArchiveState, 1)
+    return state.attendance_before if state else None
+
+
+def _archive_month(session: Session, month_start: datetime, month_end: datetime):
+    in_month = and_(
+        hot_attendance.c.check_in_time >= month_start,
+        hot_attendance.c.check_in_time < month_end,
+    )
+    columns = [c.name for c in hot_attendance.columns]
+    session.execute(
+        cold_attendance.insert().from_select(
+            columns, sa_select(*[hot_attendance.c[name] for name in columns]).where(in_month)
+        )
+    )
+
+    counts = (
+        sa_select(hot_attendance.c.user_id, literal(month_index(month_start)), func.count())
+        .where(in_month)
+        .group_by(hot_attendance.c.user_id)
+    )
+    upsert = sqlite_insert(monthly).from_select(["user_id", "month", "visits"], counts)
+    session.execute(upsert.on_conflict_do_update(
+        index_elements=["user_id", "month"],
+        set_={"visits": monthly.c.visits + upsert.excluded.visits},
+    ))
+
+    session.execute(hot_attendance.delete().where(in_month))
+
+    state = session.get(ArchiveState, 1) or ArchiveState(id=1)
+    state.attendance_before = max(state.attendance_before or month_end, month_end)
+    session.add(state)
+
+
+def run_archival(now: Optional[datetime] = None) -> int:
+    return sum(archive_branch(engine, now) for engine in engines.values())
+
+
+def archive_branch(engine, now: Optional[datetime] = None) -> int:
+    # One transaction per month keeps each write lock short; returns months moved
+    cutoff = archive_cutoff(now)
+    with Session(engine) as session:
+        oldest = session.exec(select(func.min(Attendance.check_in_time))).one()
+    if oldest is None or oldest >= cutoff:
+        return 0
+
+    moved = 0
+    month_start = _month_start(oldest)
+    while month_start < cutoff:
+        month_end = _next_month(month_start)
+        with move_lock, Session(engine) as session:
+            _archive_month(session, month_start, month_end)
+            session.commit()
+        month_start = month_end
+        moved += 1
+    return moved
+
+
+async def archival_loop():
+    while True:
+        try:
+            months = await asyncio.to_thread(run_archival)
+            if months:
+                print(f"Archived attendance for {months} month(s)")
+        except Exception as e:
+            print(f"Error archiving attendance: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_HOURS * 3600)
+
+
+def checkin_times(session: Session, start: datetime, end: datetime, user_id: Optional[int] = None) -> list:
+    # Check-in timestamps in [start, end); the archive is only read when the range reaches into it
+    def in_range(table):
+        conditions = [table.c.check_in_time >= start, table.c.check_in_time < end]
+        if user_id is not None:
+            conditions.append(table.c.user_id == user_id)
+        return sa_select(table.c.check_in_time).where(*conditions)
+
+    query = in_range(hot_attendance)
+    boundary = archived_before(session)
+    if boundary is not None and start < boundary:
+        query = union_all(query, in_range(cold_attendance))
+    return session.execute(query).scalars().all()
+
+
+def attendance_source(session: Session, since: Optional[datetime] = None):
+    # Hot and archived check-ins as one selectable (ids are unique across both); hot only when
+    # nothing is archived or the range starts after the archive watermark
+    boundary = archived_before(session)
+    if boundary is None or (since is not None and since >= boundary):
+        return hot_attendance
+    columns = lambda table: sa_select(table.c.id, table.c.user_id, table.c.check_in_time)
+    return union_all(columns(hot_attendance), columns(cold_attendance)).subquery("attendance")
+
+
+def visit_totals(session: Session, user_id: int) -> dict:
+    archived = session.exec(
+        select(func.sum(AttendanceMonthly.visits)).where(AttendanceMonthly.user_id == user_id)
+    ).one() or 0
+    recent = session.exec(
+        select(func.count(Attendance.id)).where(Attendance.user_id == user_id)
+    ).one() or 0
+    return {"archived": archived, "recent": recent, "total": archived + recent}
+
+
+if __name__ == "__main__":
+    create_db_and_tables()
+    ensure_schema()
+    print(f"Archived {run_archival()} month(s) of attendance older than {archive_cutoff():%Y-%m-%d}")
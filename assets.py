@@ -0,0 +1,178 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import sys
+import urllib.request
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are produced
+    brotli = None
+
+STATIC_DIR = "static"
+# Build output: content-hashed copies plus .gz/.br variants, served as immutable
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_FILE = os.path.join(DIST_DIR, "manifest.json")
+# Not fingerprinted: the service worker URL defines its scope and must stay stable
+SKIP = {"sw.js"}
+COMPRESSIBLE = {".js", ".css", ".json", ".svg", ".html", ".txt", ".map"}
+HASH_LENGTH = 10
+
+# Third-party scripts pinned to a version and a sha256, committed under static/vendor or fetched with
+# "python assets.py vendor". Startup never downloads; a missing file is served from the CDN.
+# A pin without a hash is never written to disk: fill it in from a copy checked by hand.
+VENDOR = {
+    "vendor/html5-qrcode.min.js": {
+        "url": "https://unpkg.com/html5-qrcode@2.3.8/html5-qrcode.min.js",
+        "sha256": None,
+    },
+    "vendor/chart.umd.js": {
+        "url": "https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.js",
+        "sha256": "db65ba70511147e08494c38a46030c89cb9e3153f455fec50440581fc67cb429",
+    },
+}
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Unversioned files (screenshots, sw.js) may be reused for an hour, then revalidated by ETag
+SHORT_LIVED = "public, max-age=3600, must-revalidate"
+
+_manifest: dict = {}
+
+
+def vendor(force: bool = False, timeout: float = 30) -> list:
+    fetched = []
+    for path, pin in VENDOR.items():
+        target = os.path.join(STATIC_DIR, path)
+        if os.path.exists(target) and not force:
+            continue
+        with urllib.request.urlopen(pin["url"], timeout=timeout) as response:
+            content = response.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if digest != pin["sha256"]:
+            print(f"Skipping {path}: sha256 {digest} does not match the pin {pin['sha256']}")
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Written under a temporary name so a failed download never leaves a truncated script
+        with open(target + ".part", "wb") as f:
+            f.write(content)
+        os.replace(target + ".part", target)
+        fetched.append(path)
+    return fetched
+
+
+def _compress(path: str, content: bytes):
+    # Variants are only kept when they are actually smaller
+    gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(gzipped) < len(content):
+        with open(path + ".gz", "wb") as f:
+            f.write(gzipped)
+    if brotli is not None:
+        compressed = brotli.compress(content, quality=11)
+        if len(compressed) < len(content):
+            with open(path + ".br", "wb") as f:
+                f.write(compressed)
+
+
+def _sources():
+    for root, dirs, files in os.walk(STATIC_DIR):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != DIST_DIR]
+        for name in files:
+            yield os.path.join(root, name)
+
+
+def build() -> dict:
+    # Rebuilds static/dist from scratch; returns {logical path: fingerprinted path}
+    shutil.rmtree(DIST_DIR, ignore_errors=True)
+    os.makedirs(DIST_DIR)
+    manifest = {}
+    for source in _sources():
+        logical = os.path.relpath(source, STATIC_DIR).replace(os.sep, "/")
+        if logical in SKIP:
+            continue
+        with open(source, "rb") as f:
+            content = f.read()
+        stem, ext = os.path.splitext(logical)
+        fingerprinted = f"{stem}.{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}{ext}"
+        target = os.path.join(DIST_DIR, fingerprinted)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(content)
+        if ext.lower() in COMPRESSIBLE:
+            _compress(target, content)
+        manifest[logical] = f"dist/{fingerprinted}"
+    with open(MANIFEST_FILE, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    _manifest.clear()
+    _manifest.update(manifest)
+    return manifest
+
+
+def ensure_built() -> dict:
+    # Startup: reuse the existing build unless a source file is newer than its manifest
+    if os.path.exists(MANIFEST_FILE):
+        built_at = os.path.getmtime(MANIFEST_FILE)
+        if all(os.path.getmtime(source) <= built_at for source in _sources()):
+            with open(MANIFEST_FILE) as f:
+                _manifest.clear()
+                _manifest.update(json.load(f))
+            return _manifest
+    return build()
+
+
+def url(path: str) -> str:
+    # Template helper: {{ asset_url('vendor/html5-qrcode.min.js') }}
+    if path in _manifest:
+        return f"/static/{_manifest[path]}"
+    if path in VENDOR and not os.path.exists(os.path.join(STATIC_DIR, path)):
+        return VENDOR[path]["url"]
+    return f"/static/{path}"
+
+
+def install(templates):
+    templates.env.globals["asset_url"] = url
+
+
+class AssetFiles(StaticFiles):
+    # Fingerprinted files get immutable caching and, when the client accepts it, a precompressed variant
+    async def get_response(self, path: str, scope):
+        fingerprinted = path.replace(os.sep, "/").startswith("dist/")
+        if fingerprinted:
+            accepted = Headers(scope=scope).get("accept-encoding", "")
+            for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+                if encoding not in accepted:
+                    continue
+                try:
+                    response = await super().get_response(path + suffix, scope)
+                except HTTPException:
+                    continue
+                response.headers["content-encoding"] = encoding
+                media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                if media_type.startswith("text/"):
+                    media_type += "; charset=utf-8"
+                response.headers["content-type"] = media_type
+                response.headers["vary"] = "Accept-Encoding"
+                response.headers["cache-control"] = IMMUTABLE
+                return response
+
+        response = await super().get_response(path, scope)
+        if fingerprinted:
+            response.headers["vary"] = "Accept-Encoding"
+        response.headers["cache-control"] = IMMUTABLE if fingerprinted else SHORT_LIVED
+        return response
+
+
+if __name__ == "__main__":
+    # python assets.py [vendor | build]
+    command = sys.argv[1] if len(sys.argv) > 1 else "build"
+    if command == "vendor":
+        print(f"Vendored: {', '.join(vendor(force='--force' in sys.argv)) or 'nothing new'}")
+    elif command == "build":
+        print(f"Fingerprinted {len(build())} assets into {DIST_DIR}")
+    else:
+        print("Usage: python assets.py [vendor [--force] | build]")
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+from database import BRANCHES
+from directory import directory_file_name
+import archive
+
+# Snapshots go to BACKUP_DIR/<YYYYmmdd-HHMMSS>/ with a manifest.json next to the copies
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", 6))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", 28))
+# Pages copied per step of the online backup; the source is only locked while a step runs
+PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", 256))
+STEP_PAUSE_SECONDS = 0.01
+MANIFEST = "manifest.json"
+
+# Scheduled and manual runs (POST /backups/run) are serialized; each one prunes what the other created
+_run_lock = threading.Lock()
+
+# Last run, for the admin page
+metrics = {"last_run": None, "duration_ms": None, "pages_copied": 0, "files_copied": 0, "files_reused": 0, "error": None}
+
+
+def database_files() -> list:
+    files = []
+    for branch in BRANCHES.values():
+        files += [branch.db_file, branch.archive_file]
+    files.append(directory_file_name)
+    return [f for f in files if os.path.exists(f)]
+
+
+def _change_counter(path: str) -> int:
+    # SQLite bumps this header field (offset 24) on every committed write in rollback-journal mode
+    with open(path, "rb") as f:
+        f.seek(24)
+        return int.from_bytes(f.read(4), "big")
+
+
+def _copy(source_path: str, target_path: str) -> int:
+    pages = 0
+
+    def progress(status, remaining, total):
+        nonlocal pages
+        pages = total
+
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        with target:
+            source.backup(target, pages=PAGES_PER_STEP, progress=progress, sleep=STEP_PAUSE_SECONDS)
+    finally:
+        target.close()
+        source.close()
+    return pages
+
+
+def verify(path: str) -> str:
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return connection.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def snapshots() -> list:
+    # Newest first, each with its manifest
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    result = []
+    for name in sorted(os.listdir(BACKUP_DIR), reverse=True):
+        manifest_path = os.path.join(BACKUP_DIR, name, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                result.append(json.load(f))
+    return result
+
+
+def _new_directory(base: str) -> tuple:
+    # Never reuse a directory: its files may be hard links into earlier snapshots. A second run
+    # within the same second gets a zero-padded suffix (-02, -03, ...) so names keep sorting in order.
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    suffix = 1
+    while True:
+        name = base if suffix == 1 else f"{base}-{suffix:02d}"
+        try:
+            os.mkdir(os.path.join(BACKUP_DIR, name))
+            return name, os.path.join(BACKUP_DIR, name)
+        except FileExistsError:
+            suffix += 1
+
+
+def create_snapshot(now: Optional[datetime] = None) -> dict:
+    # Files unchanged since the previous snapshot are hard-linked to it instead of copied again
+    started = time.perf_counter()
+    previous = next(iter(snapshots()), None)
+    name, directory = _new_directory((now or datetime.now()).strftime("%Y%m%d-%H%M%S"))
+    previous_files = {entry["file"]: entry for entry in previous["files"]} if previous else {}
+
+    entries = []
+    with archive.move_lock:
+        for source_path in database_files():
+            file_name = os.path.basename(source_path)
+            target_path = os.path.join(directory, file_name)
+            counter = _change_counter(source_path)
+            last = previous_files.get(file_name)
+            entry = {"file": file_name, "change_counter": counter, "pages": 0, "reused": False}
+            if last and last["change_counter"] == counter and last["integrity"] == "ok":
+                try:
+                    os.link(os.path.join(BACKUP_DIR, previous["name"], file_name), target_path)
+                    entry.update(reused=True, integrity="ok")
+                except OSError:
+                    pass
+            if not entry["reused"]:
+                entry["pages"] = _copy(source_path, target_path)
+                entry["integrity"] = verify(target_path)
+            entry["bytes"] = os.path.getsize(target_path)
+            entries.append(entry)
+
+    manifest = {
+        "name": name,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        "pages_copied": sum(e["pages"] for e in entries),
+        "ok": all(e["integrity"] == "ok" for e in entries),
+        "files": entries,
+    }
+    with open(os.path.join(directory, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    metrics.update(
+        last_run=manifest["created_at"],
+        duration_ms=manifest["duration_ms"],
+        pages_copied=manifest["pages_copied"],
+        files_copied=sum(1 for e in entries if not e["reused"]),
+        files_reused=sum(1 for e in entries if e["reused"]),
+        error=None if manifest["ok"] else "Falló la verificación de integridad",
+    )
+    return manifest
+
+
+def prune(keep: int = BACKUP_KEEP) -> int:
+    # Oldest snapshots beyond the retention count are removed; hard links keep shared files alive
+    removed = 0
+    for manifest in snapshots()[keep:]:
+        shutil.rmtree(os.path.join(BACKUP_DIR, manifest["name"]))
+        removed += 1
+    return removed
+
+
+def restore(name: str, files: Optional[list] = None) -> list:
+    # Copies a verified snapshot back over the live databases with the same online backup API
+    directory = os.path.join(BACKUP_DIR, name)
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    restored = []
+    for entry in manifest["files"]:
+        if files and entry["file"] not in files:
+            continue
+        snapshot_path = os.path.join(directory, entry["file"])
+        result = verify(snapshot_path)
+        if result != "ok":
+            raise ValueError(f"{entry['file']}: {result}")
+        _copy(snapshot_path, entry["file"])
+        restored.append(entry["file"])
+    return restored
+
+
+def run_backup() -> dict:
+    with _run_lock:
+        manifest = create_snapshot()
+        prune()
+        return manifest
+
+
+async def backup_loop():
+    while True:
+        await asyncio.sleep(BACKUP_INTERVAL_HOURS * 3600)
+        try:
+            manifest = await asyncio.to_thread(run_backup)
+            print(f"Backup {manifest['name']}: {manifest['pages_copied']} pages in {manifest['duration_ms']} ms")
+        except Exception as e:
+            metrics["error"] = str(e)
+            print(f"Error creating backup: {e}")
+
+
+if __name__ == "__main__":
+    # python backup.py [snapshot | list | verify <name> | restore <name> [file ...]]
+    command = sys.argv[1] if len(sys.argv) > 1 else "snapshot"
+    if command == "snapshot":
+        manifest = run_backup()
+        print(f"Snapshot {manifest['name']}: {manifest['pages_copied']} pages in {manifest['duration_ms']} ms, ok={manifest['ok']}")
+    elif command == "list":
+        for manifest in snapshots():
+            print(f"{manifest['name']}  ok={manifest['ok']}  pages={manifest['pages_copied']}  {manifest['duration_ms']} ms")
+    elif command == "verify" and len(sys.argv) > 2:
+        directory = os.path.join(BACKUP_DIR, sys.argv[2])
+        for file_name in sorted(os.listdir(directory)):
+            if file_name != MANIFEST:
+                print(f"{file_name}: {verify(os.path.join(directory, file_name))}")
+    elif command == "restore" and len(sys.argv) > 2:
+        restored = restore(sys.argv[2], sys.argv[3:] or None)
+        print(f"Restored {', '.join(restored)}. Restart the server so in-memory caches reload.")
+    else:
+        print("Usage: python backup.py [snapshot | list | verify <name> | restore <name> [file ...]]")
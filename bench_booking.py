@@ -0,0 +1,73 @@
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlmodel import SQLModel, Session, create_engine, select, func
+
+from models import User, ClassSession, Booking
+import scheduling
+
+# Booking throughput when a popular class opens: MEMBERS threads race for CAPACITY seats,
+# then a share of the booked members cancel and the waitlist is promoted.
+# Usage: python bench_booking.py [members] [capacity] [threads]
+MEMBERS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+CAPACITY = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+THREADS = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+
+def run_benchmark():
+    path = os.path.join(tempfile.mkdtemp(), "bench_booking.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+    SQLModel.metadata.create_all(engine)
+
+    with Session(engine) as session:
+        session.add_all([User(name=f"Socio {i}", email=f"socio{i}@bench.local") for i in range(MEMBERS)])
+        class_session = ClassSession(
+            name="Spinning", capacity=CAPACITY,
+            starts_at=datetime.utcnow() + timedelta(days=1), ends_at=datetime.utcnow() + timedelta(days=1, hours=1)
+        )
+        session.add(class_session)
+        session.commit()
+        class_id = class_session.id
+        user_ids = session.exec(select(User.id)).all()
+
+    def book(user_id):
+        with Session(engine) as session:
+            return scheduling.book(session, class_id, user_id)["status"]
+
+    def cancel(user_id):
+        with Session(engine) as session:
+            return scheduling.cancel(session, class_id, user_id)["promoted_user_id"]
+
+    print(f"{MEMBERS} members, {CAPACITY} seats, {THREADS} threads")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(THREADS) as pool:
+        statuses = list(pool.map(book, user_ids))
+    elapsed = time.perf_counter() - started
+    print(f"Booking:    {MEMBERS / elapsed:,.0f} bookings/s ({elapsed * 1000:,.0f} ms total)")
+
+    booked_ids = [uid for uid, status in zip(user_ids, statuses) if status == "booked"]
+    cancelling = booked_ids[: CAPACITY // 2]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(THREADS) as pool:
+        promoted = [p for p in pool.map(cancel, cancelling) if p is not None]
+    elapsed = time.perf_counter() - started
+    print(f"Cancelling: {len(cancelling) / elapsed:,.0f} cancellations/s, {len(promoted)} promoted from the waitlist")
+
+    # Counters must match the booking rows exactly and never exceed the capacity
+    with Session(engine) as session:
+        class_session = session.get(ClassSession, class_id)
+        counts = dict(session.exec(
+            select(Booking.status, func.count()).where(Booking.class_id == class_id).group_by(Booking.status)
+        ).all())
+    print(f"Seats {class_session.booked}/{class_session.capacity}, waitlist {class_session.waitlisted}, rows {counts}")
+    consistent = (
+        class_session.booked == counts.get("booked", 0) <= CAPACITY
+        and class_session.waitlisted == counts.get("waitlisted", 0)
+        and statuses.count("booked") == min(CAPACITY, MEMBERS)
+    )
+    print("SUCCESS: no overbooking, counters consistent." if consistent else "FAILED: counters out of sync!")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,81 @@
+import json
+import sys
+from datetime import datetime
+from typing import Callable, Optional, TextIO
+from sqlmodel import Session, select
+from database import engines, create_db_and_tables
+from models import ChangeEvent, ChangeCursor
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def record(session: Session, entity: str, entity_id: Optional[int], op: str, data: Optional[dict] = None):
+    # Added to the caller's transaction, so the event commits (or rolls back) with the change.
+    # SQLite allows one writer at a time, so sequence order is also commit order.
+    session.add(ChangeEvent(entity=entity, entity_id=entity_id, op=op, data=data))
+
+
+def snapshot(obj, *fields) -> dict:
+    return obj.model_dump(mode="json", include=set(fields))
+
+
+def read(session: Session, after: int = 0, limit: int = DEFAULT_BATCH_SIZE) -> list:
+    return session.exec(
+        select(ChangeEvent).where(ChangeEvent.id > after).order_by(ChangeEvent.id).limit(limit)
+    ).all()
+
+
+def position(session: Session, consumer: str) -> int:
+    cursor = session.get(ChangeCursor, consumer)
+    return cursor.position if cursor else 0
+
+
+def consume(
+    session: Session,
+    consumer: str,
+    handler: Callable[[Session, list], None],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    entities=None,
+) -> int:
+    # Feeds new events to handler(session, events) in batches. The cursor is advanced in the
+    # same transaction as whatever the handler writes, so a projection in this database
+    # resumes exactly after its last committed batch. Returns the number of events processed.
+    processed = 0
+    while True:
+        cursor = session.get(ChangeCursor, consumer) or ChangeCursor(consumer=consumer)
+        events = read(session, cursor.position, batch_size)
+        if not events:
+            session.rollback()
+            return processed
+        # Filtered consumers still move their cursor past the events they skip
+        wanted = [event for event in events if not entities or event.entity in entities]
+        if wanted:
+            handler(session, wanted)
+        cursor.position = events[-1].id
+        cursor.updated_at = datetime.utcnow()
+        session.add(cursor)
+        session.commit()
+        processed += len(wanted)
+
+
+def export(session: Session, consumer: str, out: TextIO, branch: str, entities=None) -> int:
+    # Appends new events to out as JSON lines. Each batch is flushed before its cursor commits,
+    # so after a crash the next run re-sends at most that one batch and never skips any.
+    def write(session: Session, events: list):
+        for event in events:
+            out.write(json.dumps({"branch": branch, **event.model_dump(mode="json")}) + "\n")
+        out.flush()
+
+    return consume(session, consumer, write, entities=entities)
+
+
+if __name__ == "__main__":
+    # python changelog.py export <consumer> [entity ...] >> changes.jsonl
+    if len(sys.argv) > 2 and sys.argv[1] == "export":
+        create_db_and_tables()
+        for slug, engine in engines.items():
+            with Session(engine) as session:
+                exported = export(session, sys.argv[2], sys.stdout, slug, sys.argv[3:] or None)
+            print(f"{slug}: exported {exported} change(s) for {sys.argv[2]}", file=sys.stderr)
+    else:
+        print("Usage: python changelog.py export <consumer> [entity ...]")
@@ -0,0 +1,181 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional
+from sqlmodel import Session, select, delete, func
+from models import Subscription, MemberCohort, CohortStat, MonthlyChurn
+
+# Subscriptions are streamed from the database in chunks of this size during a rebuild
+REBUILD_CHUNK_SIZE = 1000
+
+
+def month_index(dt: datetime) -> int:
+    return dt.year * 12 + dt.month - 1
+
+
+def month_label(index: int) -> str:
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def _apply_subscription(member: Optional[MemberCohort], user_id: int, start: datetime, end: datetime):
+    # Pure transition shared by the incremental path and the rebuild.
+    # Returns the updated member and the aggregate deltas it implies.
+    start_m, end_m = month_index(start), month_index(end)
+    deltas = []
+
+    if member is None:
+        member = MemberCohort(user_id=user_id, cohort_month=start_m, active_through=start_m - 1)
+        deltas.append((MonthlyChurn, start_m, "new", 1))
+    elif member.churned_month is not None:
+        if start_m <= member.churned_month:
+            # Renewed within the month they were marked churned: not a churn after all
+            deltas.append((MonthlyChurn, member.churned_month, "churned", -1))
+        else:
+            deltas.append((MonthlyChurn, start_m, "returned", 1))
+        member.churned_month = None
+    elif start_m > member.active_through + 1:
+        # Lapse that the expiry sweep has not seen yet
+        deltas.append((MonthlyChurn, member.active_through + 1, "churned", 1))
+        deltas.append((MonthlyChurn, start_m, "returned", 1))
+
+    # Months already counted for this member are never counted twice
+    for month in range(max(start_m, member.active_through + 1), end_m + 1):
+        deltas.append((CohortStat, (member.cohort_month, month - member.cohort_month), "active", 1))
+    member.active_through = max(member.active_through, end_m)
+    return member, deltas
+
+
+def _apply_deltas(session: Session, deltas):
+    for model, key, field, amount in deltas:
+        row = session.get(model, key)
+        if row is None:
+            if model is CohortStat:
+                row = CohortStat(cohort_month=key[0], month_offset=key[1])
+            else:
+                row = MonthlyChurn(month=key)
+        setattr(row, field, getattr(row, field) + amount)
+        session.add(row)
+
+
+def record_subscription(session: Session, subscription: Subscription):
+    # Called inside the payment transaction; the caller commits
+    member = session.get(MemberCohort, subscription.user_id)
+    member, deltas = _apply_subscription(
+        member, subscription.user_id, subscription.start_date, subscription.end_date
+    )
+    session.add(member)
+    _apply_deltas(session, deltas)
+
+
+def sweep_expired(session: Session, now: Optional[datetime] = None, commit: bool = True) -> int:
+    # Members whose coverage ended before the current month churned in the month after it
+    current = month_index(now or datetime.utcnow())
+    expired = session.exec(
+        select(MemberCohort).where(
+            MemberCohort.churned_month == None,  # noqa: E711
+            MemberCohort.active_through < current,
+        )
+    ).all()
+    for member in expired:
+        member.churned_month = member.active_through + 1
+        session.add(member)
+        _apply_deltas(session, [(MonthlyChurn, member.churned_month, "churned", 1)])
+    if commit and expired:
+        session.commit()
+    return len(expired)
+
+
+def rebuild(session: Session, now: Optional[datetime] = None):
+    # One ordered pass over every subscription; aggregates are accumulated in memory
+    session.exec(delete(MemberCohort))
+    session.exec(delete(CohortStat))
+    session.exec(delete(MonthlyChurn))
+
+    stats = defaultdict(int)
+    churn = defaultdict(lambda: {"new": 0, "churned": 0, "returned": 0})
+    members = {}
+
+    rows = session.exec(
+        select(Subscription.user_id, Subscription.start_date, Subscription.end_date)
+        .order_by(Subscription.user_id, Subscription.start_date)
+        .execution_options(yield_per=REBUILD_CHUNK_SIZE)
+    )
+    for user_id, start, end in rows:
+        member, deltas = _apply_subscription(members.get(user_id), user_id, start, end)
+        members[user_id] = member
+        for model, key, field, amount in deltas:
+            if model is CohortStat:
+                stats[key] += amount
+            else:
+                churn[key][field] += amount
+
+    session.add_all(members.values())
+    session.add_all(
+        CohortStat(cohort_month=c, month_offset=o, active=n) for (c, o), n in stats.items()
+    )
+    session.add_all(MonthlyChurn(month=m, **fields) for m, fields in churn.items())
+    session.flush()
+    sweep_expired(session, now, commit=False)
+    session.commit()
+
+
+def ensure_built(session: Session):
+    # First start after upgrading: derive the aggregates from existing history
+    has_members = session.exec(select(MemberCohort.user_id).limit(1)).first() is not None
+    has_subscriptions = session.exec(select(Subscription.id).limit(1)).first() is not None
+    if has_subscriptions and not has_members:
+        rebuild(session)
+    else:
+        sweep_expired(session)
+
+
+def cohort_report(session: Session, months: int = 12, now: Optional[datetime] = None) -> dict:
+    current = month_index(now or datetime.utcnow())
+    first = current - months + 1
+
+    cells = session.exec(
+        select(CohortStat).where(CohortStat.cohort_month >= first)
+    ).all()
+    matrix = defaultdict(dict)
+    for cell in cells:
+        if cell.cohort_month + cell.month_offset <= current:
+            matrix[cell.cohort_month][cell.month_offset] = cell.active
+
+    cohorts = []
+    for cohort in sorted(matrix):
+        size = matrix[cohort].get(0, 0)
+        active = [matrix[cohort].get(k, 0) for k in range(current - cohort + 1)]
+        cohorts.append({
+            "cohort": month_label(cohort),
+            "size": size,
+            "active": active,
+            "retention": [round(100 * n / size, 1) if size else 0.0 for n in active],
+        })
+
+    # Active members per calendar month, across every cohort (one grouped query on a small table)
+    calendar_month = CohortStat.cohort_month + CohortStat.month_offset
+    active_by_month = dict(session.exec(
+        select(calendar_month, func.sum(CohortStat.active))
+        .where(calendar_month >= first - 1, calendar_month <= current)
+        .group_by(calendar_month)
+    ).all())
+    churn_rows = {
+        row.month: row for row in session.exec(
+            select(MonthlyChurn).where(MonthlyChurn.month >= first, MonthlyChurn.month <= current)
+        ).all()
+    }
+
+    churn = []
+    for month in range(first, current + 1):
+        row = churn_rows.get(month)
+        previous_active = active_by_month.get(month - 1, 0)
+        churned = row.churned if row else 0
+        churn.append({
+            "month": month_label(month),
+            "active": active_by_month.get(month, 0),
+            "new": row.new if row else 0,
+            "churned": churned,
+            "returned": row.returned if row else 0,
+            "churn_rate": round(100 * churned / previous_active, 1) if previous_active else 0.0,
+        })
+
+    return {"cohorts": cohorts, "churn": churn}
@@ -0,0 +1,84 @@
+import base64
+import hashlib
+import hmac
+import os
+import time
+from datetime import datetime
+from typing import NamedTuple, Optional
+from dotenv import load_dotenv
+from sqlmodel import Session, select, func
+
+from models import Subscription
+
+load_dotenv()
+
+# Signed member credentials: "GM1.<branch>.<user_id>.<expiry>.<window>.<signature>".
+# The window rotates every QR_ROTATE_SECONDS, so a screenshot stops working shortly after
+# it was taken, and a scan is verified with one HMAC instead of a database lookup.
+PREFIX = "GM1"
+ROTATE_SECONDS = int(os.getenv("QR_ROTATE_SECONDS", 30))
+# Windows accepted on either side of the current one (clock skew, slow scanners)
+GRACE_WINDOWS = 1
+SIGNATURE_BYTES = 12
+
+_key = hashlib.sha256(b"member-qr:" + os.getenv("SECRET_KEY", "super-secret-key-change-me").encode()).digest()
+
+
+class Credential(NamedTuple):
+    branch: str
+    user_id: int
+    expires: int  # membership end as epoch seconds, 0 when the member never subscribed
+
+    @property
+    def active(self) -> bool:
+        return self.expires > time.time()
+
+
+def _sign(message: str) -> str:
+    digest = hmac.new(_key, message.encode(), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+def current_window(now: Optional[float] = None) -> int:
+    return int((now or time.time()) // ROTATE_SECONDS)
+
+def issue(branch: str, user_id: int, expires: Optional[datetime], now: Optional[float] = None) -> str:
+    # Subscription dates are naive UTC
+    expiry = int((expires - datetime(1970, 1, 1)).total_seconds()) if expires else 0
+    message = f"{PREFIX}.{branch}.{user_id}.{expiry}.{current_window(now)}"
+    return f"{message}.{_sign(message)}"
+
+def is_signed(payload: str) -> bool:
+    return payload.startswith(PREFIX + ".")
+
+def verify(payload: str, now: Optional[float] = None) -> Optional[Credential]:
+    parts = payload.split(".")
+    if len(parts) != 6 or parts[0] != PREFIX:
+        return None
+    message, signature = payload.rsplit(".", 1)
+    if not hmac.compare_digest(signature, _sign(message)):
+        return None
+    try:
+        user_id, expiry, window = int(parts[2]), int(parts[3]), int(parts[4])
+    except ValueError:
+        return None
+    if abs(current_window(now) - window) > GRACE_WINDOWS:
+        return None
+    return Credential(parts[1], user_id, expiry)
+
+def seconds_to_rotation(now: Optional[float] = None) -> int:
+    now = now or time.time()
+    return int(ROTATE_SECONDS - now % ROTATE_SECONDS) or ROTATE_SECONDS
+
+def membership_expiry(session: Session, user_id: int) -> Optional[datetime]:
+    return session.exec(
+        select(func.max(Subscription.end_date)).where(Subscription.user_id == user_id)
+    ).one()
+
+def issue_for(session: Session, branch: str, user_id: int) -> dict:
+    payload = issue(branch, user_id, membership_expiry(session, user_id))
+    return {
+        "qr": payload,
+        # The signature changes with every payload, so it doubles as a cache-busting version
+        "version": payload.rsplit(".", 1)[1],
+        "refresh_in": seconds_to_rotation(),
+    }
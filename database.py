@@ -1,18 +1,129 @@
 from sqlmodel import SQLModel, create_engine, Session
-from typing import Annotated
-from fastapi import Depends
+from sqlalchemy import event, inspect, text
+from typing import Annotated, NamedTuple, Optional
+from fastapi import Depends, Request
+import asyncio
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
 
 sqlite_file_name = "gym.db"
 sqlite_url = f"sqlite:///{sqlite_file_name}"
 
+# Cold attendance history lives in its own file, attached to every connection as "archive"
+archive_file_name = "gym_archive.db"
+
 connect_args = {"check_same_thread": False}
-engine = create_engine(sqlite_url, connect_args=connect_args)
+
+class Branch(NamedTuple):
+    slug: str
+    name: str
+    db_file: str
+    archive_file: str
+
+# GYM_BRANCHES="centro:Sede Centro,norte:Sede Norte". The first branch is the default and keeps
+# the original file names, so a single-site install (no GYM_BRANCHES) is unchanged.
+def load_branches(spec: str) -> dict:
+    branches = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        slug, _, name = entry.partition(":")
+        slug = slug.strip().lower()
+        if not branches:
+            db_file, archive_file = sqlite_file_name, archive_file_name
+        else:
+            db_file, archive_file = f"gym_{slug}.db", f"gym_{slug}_archive.db"
+        branches[slug] = Branch(slug, name.strip() or slug, db_file, archive_file)
+    return branches or {"main": Branch("main", "Principal", sqlite_file_name, archive_file_name)}
+
+BRANCHES = load_branches(os.getenv("GYM_BRANCHES", ""))
+DEFAULT_BRANCH = next(iter(BRANCHES))
+
+def _create_branch_engine(branch: Branch):
+    branch_engine = create_engine(f"sqlite:///{branch.db_file}", connect_args=connect_args)
+
+    @event.listens_for(branch_engine, "connect")
+    def attach_archive(dbapi_connection, connection_record):
+        dbapi_connection.execute("ATTACH DATABASE ? AS archive", (branch.archive_file,))
+
+    return branch_engine
+
+engines = {slug: _create_branch_engine(branch) for slug, branch in BRANCHES.items()}
+engine = engines[DEFAULT_BRANCH]
+
+def get_engine(branch: Optional[str] = None):
+    return engines.get(branch or DEFAULT_BRANCH, engine)
+
+def resolve_branch(slug: Optional[str]) -> str:
+    slug = (slug or "").strip().lower()
+    return slug if slug in BRANCHES else DEFAULT_BRANCH
+
+def request_branch(request: Request) -> str:
+    # Scanners and API clients send a header; browsers keep the admin's choice in a cookie
+    return resolve_branch(
+        request.headers.get("x-branch")
+        or request.query_params.get("branch")
+        or request.cookies.get("branch")
+    )
+
+def _sql_literal(value) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+def upgrade_tables(target_engine):
+    # create_all never alters existing tables; add columns and indexes introduced since they were created
+    inspector = inspect(target_engine)
+    with target_engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column.type.compile(target_engine.dialect)}'
+                if column.default is not None and column.default.is_scalar:
+                    ddl += f" NOT NULL DEFAULT {_sql_literal(column.default.arg)}"
+                connection.execute(text(ddl))
+            if table.kwargs.get("sqlite_autoincrement"):
+                _enable_autoincrement(connection, table)
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+def _enable_autoincrement(connection, table):
+    # SQLite can't add AUTOINCREMENT to an existing key: recreate the table and copy the rows over
+    sql = connection.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table.name}
+    ).scalar()
+    if not sql or "AUTOINCREMENT" in sql.upper():
+        return
+    connection.execute(text(f'ALTER TABLE "{table.name}" RENAME TO "{table.name}_old"'))
+    for index in table.indexes:
+        connection.execute(text(f'DROP INDEX IF EXISTS "{index.name}"'))
+    table.create(connection)
+    columns = ", ".join(f'"{column.name}"' for column in table.columns)
+    connection.execute(text(f'INSERT INTO "{table.name}" ({columns}) SELECT {columns} FROM "{table.name}_old"'))
+    connection.execute(text(f'DROP TABLE "{table.name}_old"'))
 
 def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+    for branch_engine in engines.values():
+        SQLModel.metadata.create_all(branch_engine)
+        upgrade_tables(branch_engine)
 
-def get_session():
-    with Session(engine) as session:
+def get_session(request: Request):
+    with Session(get_engine(request_branch(request))) as session:
         yield session
 
 SessionDep = Annotated[Session, Depends(get_session)]
+
+async def fan_out(fn) -> dict:
+    # Run fn(session, branch) against every shard in parallel threads
+    def run(branch: Branch):
+        with Session(engines[branch.slug]) as session:
+            return fn(session, branch)
+
+    results = await asyncio.gather(*(asyncio.to_thread(run, b) for b in BRANCHES.values()))
+    return dict(zip(BRANCHES, results))
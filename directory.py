@@ -0,0 +1,75 @@
+from typing import Optional
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session
+from database import Branch, connect_args
+from models import User
+
+# Global member directory shared by every branch: which shard a QR code belongs to
+UPSERT_CHUNK_SIZE = 500
+directory_file_name = "gym_directory.db"
+directory_engine = create_engine(f"sqlite:///{directory_file_name}", connect_args=connect_args)
+
+directory_metadata = MetaData()
+members = Table(
+    "member_directory",
+    directory_metadata,
+    Column("qr_code_data", String, primary_key=True),
+    Column("email", String, nullable=False, index=True),
+    Column("branch", String, nullable=False),
+    Column("user_id", Integer, nullable=False),
+)
+
+
+def create_directory():
+    directory_metadata.create_all(directory_engine)
+
+
+def _upsert(rows: list):
+    with directory_engine.begin() as connection:
+        for i in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            statement = sqlite_insert(members).values(rows[i:i + UPSERT_CHUNK_SIZE])
+            statement = statement.on_conflict_do_update(
+                index_elements=["qr_code_data"],
+                set_={
+                    "email": statement.excluded.email,
+                    "branch": statement.excluded.branch,
+                    "user_id": statement.excluded.user_id,
+                },
+            )
+            connection.execute(statement)
+
+
+def register_member(user: User, branch: str):
+    if user.role != "client" or not user.qr_code_data:
+        return
+    _upsert([{"qr_code_data": user.qr_code_data, "email": user.email, "branch": branch, "user_id": user.id}])
+
+
+def sync_branch(session: Session, branch: Branch):
+    # Backfill members created before the directory existed (or while it was unavailable)
+    rows = session.execute(
+        select(User.qr_code_data, User.email, User.id).where(
+            User.role == "client", User.qr_code_data != None  # noqa: E711
+        )
+    ).all()
+    _upsert([
+        {"qr_code_data": qr, "email": email, "branch": branch.slug, "user_id": user_id}
+        for qr, email, user_id in rows
+    ])
+
+
+def home_branch(email: str) -> Optional[str]:
+    # Members log in without picking a branch; their account lives on the shard that registered them
+    with directory_engine.connect() as connection:
+        return connection.execute(
+            select(members.c.branch).where(members.c.email == email)
+        ).scalar()
+
+
+def lookup(qr_code: str) -> Optional[dict]:
+    with directory_engine.connect() as connection:
+        row = connection.execute(
+            select(members.c.branch, members.c.user_id).where(members.c.qr_code_data == qr_code)
+        ).first()
+    return {"branch": row.branch, "user_id": row.user_id} if row else None
@@ -0,0 +1,134 @@
+import os
+from datetime import date, datetime
+from typing import Optional
+import numpy as np
+from sqlmodel import Session, select
+from models import Plan, Subscription
+
+HORIZONS = (30, 60, 90)
+# A membership counts as renewed when the member's next subscription starts within this many days of its end
+GRACE_DAYS = 14
+# Plans with little history lean on the gym-wide rate: PRIOR_WEIGHT pseudo-observations at that rate
+PRIOR_WEIGHT = 5
+# Used only until the first membership has run its course
+DEFAULT_RENEWAL_RATE = float(os.getenv("FORECAST_DEFAULT_RENEWAL_RATE", 0.5))
+SECONDS_PER_DAY = 86400
+
+# One report per database, valid for the day it was computed; payments and plan edits drop it
+_cache: dict = {}
+
+
+def invalidate_cache():
+    _cache.clear()
+
+
+def _days(values, now: datetime) -> np.ndarray:
+    stamps = np.array(values, dtype="datetime64[s]").astype(np.int64)
+    return (stamps - np.datetime64(now, "s").astype(np.int64)) / SECONDS_PER_DAY
+
+
+def renewal_rates(user_ids: np.ndarray, plan_idx: np.ndarray, starts: np.ndarray, ends: np.ndarray, n_plans: int):
+    # Arrays are in days relative to now; only memberships past their grace period have an outcome
+    order = np.lexsort((starts, user_ids))
+    user_ids, plan_idx, starts, ends = user_ids[order], plan_idx[order], starts[order], ends[order]
+    same_member = np.append(user_ids[1:] == user_ids[:-1], False)
+    next_start = np.append(starts[1:], np.inf)
+    renewed = same_member & (next_start <= ends + GRACE_DAYS)
+    resolved = (ends + GRACE_DAYS <= 0) & (plan_idx >= 0)
+
+    observed = np.bincount(plan_idx[resolved], minlength=n_plans)
+    renewals = np.bincount(plan_idx[resolved], weights=renewed[resolved].astype(float), minlength=n_plans)
+    overall = renewals.sum() / observed.sum() if observed.sum() else DEFAULT_RENEWAL_RATE
+    rates = (renewals + PRIOR_WEIGHT * overall) / (observed + PRIOR_WEIGHT)
+    return rates, observed, float(overall)
+
+
+def project(ends: np.ndarray, rates: np.ndarray, prices: np.ndarray, durations: np.ndarray, horizon: int) -> dict:
+    # Each membership renews at its end and then every plan period, with the plan's rate each time:
+    # n renewal points fall inside the horizon, the k-th is paid with probability rate**k
+    n = np.where(ends <= horizon, np.floor((horizon - ends) / durations) + 1, 0)
+    survival = rates ** n
+    renewals = np.where(rates < 1, rates * (1 - survival) / np.where(rates < 1, 1 - rates, 1), n)
+    return {
+        "days": horizon,
+        "expiring": int(np.count_nonzero((ends > 0) & (ends <= horizon))),
+        "expected_renewals": round(float(renewals.sum()), 1),
+        "expected_revenue": round(float((renewals * prices).sum()), 2),
+        "expected_members": round(float(survival.sum()), 1),
+    }
+
+
+def compute_forecast(session: Session, now: Optional[datetime] = None) -> dict:
+    now = now or datetime.utcnow()
+    plans = session.exec(select(Plan.id, Plan.name, Plan.price, Plan.duration_days).order_by(Plan.id)).all()
+    rows = session.exec(
+        select(Subscription.user_id, Subscription.plan_id, Subscription.start_date, Subscription.end_date, Subscription.active)
+    ).all()
+
+    plan_ids = np.array([p.id for p in plans], dtype=np.int64)
+    prices = np.array([p.price for p in plans], dtype=float)
+    durations = np.array([max(p.duration_days, 1) for p in plans], dtype=float)
+    report = {
+        "generated_at": now.isoformat(timespec="seconds"),
+        "grace_days": GRACE_DAYS,
+        "current_members": 0,
+        "horizons": [project(np.empty(0), np.empty(0), np.empty(0), np.empty(0), h) for h in HORIZONS],
+        "overall_renewal_rate": DEFAULT_RENEWAL_RATE,
+        "plans": [],
+    }
+    if not rows or not plans:
+        return report
+
+    user_ids = np.array([r.user_id for r in rows], dtype=np.int64)
+    sub_plans = np.array([r.plan_id for r in rows], dtype=np.int64)
+    active = np.array([r.active for r in rows], dtype=bool)
+    starts = _days([r.start_date for r in rows], now)
+    ends = _days([r.end_date for r in rows], now)
+    # Subscriptions of deleted plans keep their history out of every plan's rate
+    plan_idx = np.searchsorted(plan_ids, sub_plans).clip(max=plan_ids.size - 1)
+    plan_idx = np.where(plan_ids[plan_idx] == sub_plans, plan_idx, -1)
+
+    rates, observed, overall = renewal_rates(user_ids, plan_idx, starts, ends, plan_ids.size)
+
+    # The pipeline: each member's last active subscription, if it has not lapsed past the grace period.
+    # Renewals are chained, so earlier subscriptions of the same member already have a successor.
+    order = np.lexsort((ends, user_ids))
+    last = order[np.append(user_ids[order][1:] != user_ids[order][:-1], True)]
+    last = last[active[last] & (ends[last] > -GRACE_DAYS) & (plan_idx[last] >= 0)]
+    pipeline_plans = plan_idx[last]
+    pipeline_ends = ends[last]
+
+    report.update(
+        current_members=int(np.count_nonzero(pipeline_ends > 0)),
+        horizons=[
+            project(pipeline_ends, rates[pipeline_plans], prices[pipeline_plans], durations[pipeline_plans], h)
+            for h in HORIZONS
+        ],
+        overall_renewal_rate=round(overall, 3),
+    )
+    expiring = np.bincount(
+        pipeline_plans[(pipeline_ends > 0) & (pipeline_ends <= HORIZONS[0])], minlength=plan_ids.size
+    )
+    report["plans"] = [
+        {
+            "plan_id": int(plan_ids[i]),
+            "name": plans[i].name,
+            "price": float(prices[i]),
+            "renewal_rate": round(float(rates[i]), 3),
+            "observed": int(observed[i]),
+            f"expiring_{HORIZONS[0]}": int(expiring[i]),
+        }
+        for i in range(plan_ids.size)
+    ]
+    return report
+
+
+def forecast_report(session: Session) -> dict:
+    key = str(session.get_bind().url)
+    today = date.today()
+    cached = _cache.get(key)
+    if cached and cached[0] == today:
+        return cached[1]
+    report = compute_forecast(session)
+    _cache[key] = (today, report)
+    return report
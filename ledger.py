@@ -0,0 +1,82 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+from models import LedgerEntry, MemberAccount, Payment
+
+# Sign applied to the balance per entry kind; a positive balance means the member owes money
+BALANCE_SIGN = {"charge": 1, "payment": -1}
+TOTAL_COLUMN = {"charge": "total_charged", "payment": "total_paid"}
+
+
+def post_entry(
+    session: Session,
+    user_id: int,
+    kind: str,
+    amount: float,
+    description: Optional[str] = None,
+    payment_id: Optional[int] = None,
+) -> LedgerEntry:
+    # The account row is changed with one atomic UPDATE ... RETURNING, so concurrent
+    # payments for the same member serialize on the write lock instead of losing updates
+    session.execute(
+        sqlite_insert(MemberAccount.__table__).values(user_id=user_id).on_conflict_do_nothing()
+    )
+    total = getattr(MemberAccount, TOTAL_COLUMN[kind])
+    balance_after = session.execute(
+        update(MemberAccount)
+        .where(MemberAccount.user_id == user_id)
+        .values(
+            balance=MemberAccount.balance + BALANCE_SIGN[kind] * amount,
+            updated_at=datetime.utcnow(),
+            **{TOTAL_COLUMN[kind]: total + amount},
+        )
+        .returning(MemberAccount.balance)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
+
+    entry = LedgerEntry(
+        user_id=user_id,
+        payment_id=payment_id,
+        kind=kind,
+        amount=amount,
+        balance_after=balance_after,
+        description=description,
+    )
+    session.add(entry)
+    return entry
+
+
+def account(session: Session, user_id: int) -> MemberAccount:
+    # O(1) financial summary; members without ledger activity get an empty account
+    return session.get(MemberAccount, user_id) or MemberAccount(user_id=user_id)
+
+
+def ensure_built(session: Session):
+    # First start after upgrading: open accounts from the existing payment history
+    if session.exec(select(MemberAccount.user_id).limit(1)).first() is not None:
+        return
+    payments = session.exec(select(Payment).order_by(Payment.date)).all()
+    if not payments:
+        return
+
+    accounts = {}
+    for payment in payments:
+        current = accounts.setdefault(payment.user_id, MemberAccount(user_id=payment.user_id))
+        current.total_charged += payment.amount
+        current.total_paid += payment.amount
+        current.updated_at = payment.date
+        # Historical payments settled their own charge, so the balance stays at zero
+        for kind in ("charge", "payment"):
+            session.add(LedgerEntry(
+                user_id=payment.user_id,
+                payment_id=payment.id,
+                kind=kind,
+                amount=payment.amount,
+                balance_after=0 if kind == "payment" else payment.amount,
+                description="Saldo inicial",
+                created_at=payment.date,
+            ))
+    session.add_all(accounts.values())
+    session.commit()
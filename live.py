@@ -0,0 +1,107 @@
+import asyncio
+import json
+import os
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlmodel import Session, select
+from database import BRANCHES, DEFAULT_BRANCH
+from models import Attendance, User
+
+AVERAGE_VISIT_MINUTES = int(os.getenv("AVERAGE_VISIT_MINUTES", 90))
+RECENT_ARRIVALS = int(os.getenv("LIVE_RECENT_ARRIVALS", 5))
+# Slow dashboards get dropped events rather than holding memory for everyone
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def today_start_utc() -> datetime:
+    # Local midnight expressed in the naive-UTC convention used by Attendance.check_in_time
+    local_now = datetime.now().astimezone()
+    local_midnight = local_now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return (local_midnight - local_now.utcoffset()).replace(tzinfo=None)
+
+
+class LiveCounter:
+    def __init__(self):
+        self.day_start = today_start_utc()
+        self.today_checkins = 0
+        self.window_arrivals: deque = deque()
+        self.recent: deque = deque(maxlen=RECENT_ARRIVALS)
+        self.subscribers: set = set()
+
+    def _roll(self, now: datetime):
+        if now >= self.day_start + timedelta(days=1):
+            self.day_start = today_start_utc()
+            self.today_checkins = 0
+        horizon = now - timedelta(minutes=AVERAGE_VISIT_MINUTES)
+        while self.window_arrivals and self.window_arrivals[0] < horizon:
+            self.window_arrivals.popleft()
+
+    def load(self, session: Session):
+        # Seed from the database once at startup; afterwards state only moves through record()
+        now = datetime.utcnow()
+        self.day_start = today_start_utc()
+        horizon = min(self.day_start, now - timedelta(minutes=AVERAGE_VISIT_MINUTES))
+        rows = session.exec(
+            select(Attendance.check_in_time, User.name)
+            .join(User, User.id == Attendance.user_id)
+            .where(Attendance.check_in_time >= horizon)
+            .order_by(Attendance.check_in_time)
+        ).all()
+        self.today_checkins = sum(1 for when, _ in rows if when >= self.day_start)
+        self.window_arrivals = deque(when for when, _ in rows)
+        self.recent.clear()
+        for when, name in rows[-RECENT_ARRIVALS:]:
+            self.recent.appendleft({"name": name, "time": when.isoformat() + "Z"})
+        self._roll(now)
+
+    def snapshot(self) -> dict:
+        self._roll(datetime.utcnow())
+        return {
+            "today": self.today_checkins,
+            "occupancy": len(self.window_arrivals),
+            "window_minutes": AVERAGE_VISIT_MINUTES,
+            "recent": list(self.recent),
+        }
+
+    def record(self, name: str, when: Optional[datetime] = None):
+        when = when or datetime.utcnow()
+        self._roll(when)
+        self.today_checkins += 1
+        self.window_arrivals.append(when)
+        arrival = {"name": name, "time": when.isoformat() + "Z"}
+        self.recent.appendleft(arrival)
+        self.publish({
+            "type": "checkin",
+            "today": self.today_checkins,
+            "occupancy": len(self.window_arrivals),
+            "arrival": arrival,
+        })
+
+    def publish(self, event: dict):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                pass
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+
+# One counter per branch; check-ins are counted where the member walked in
+counters = {slug: LiveCounter() for slug in BRANCHES}
+counter = counters[DEFAULT_BRANCH]
+
+
+def counter_for(branch: str) -> LiveCounter:
+    return counters.get(branch, counter)
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -1,24 +1,63 @@
 from fastapi import FastAPI, Request
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from database import create_db_and_tables, engine
+from database import create_db_and_tables, engines, BRANCHES
 from sqlmodel import Session
 from routers import auth
+import assets
+import asyncio
+import live
+import cohorts
+import archive
+import directory
+import activity
+import ledger
+import notifications
+import backup
+import credentials
+import scheduling
+import ratelimit
+import profiler
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    assets.ensure_built()
     create_db_and_tables()
-    with Session(engine) as session:
-        auth.create_initial_admin(session)
+    archive.ensure_schema()
+    directory.create_directory()
+    for slug, branch in BRANCHES.items():
+        with Session(engines[slug]) as session:
+            auth.create_initial_admin(session)
+            live.counter_for(slug).load(session)
+            cohorts.ensure_built(session)
+            ledger.ensure_built(session)
+            activity.ensure_built(session)
+            directory.sync_branch(session, branch)
+    archival_task = asyncio.create_task(archive.archival_loop())
+    notification_task = asyncio.create_task(notifications.worker_loop())
+    backup_task = asyncio.create_task(backup.backup_loop())
     yield
+    archival_task.cancel()
+    notification_task.cancel()
+    backup_task.cancel()
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(profiler.ProfilerMiddleware)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+@app.exception_handler(ratelimit.RateLimited)
+async def rate_limited_handler(request: Request, exc: ratelimit.RateLimited):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"status": "error", "message": exc.message},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+app.mount("/static", assets.AssetFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
+assets.install(templates)
+templates.env.filters["local"] = scheduling.to_local
 
 from routers import users
 app.include_router(users.router)
@@ -30,13 +69,25 @@ from routers import plans
 app.include_router(plans.router)
 from routers import routines
 app.include_router(routines.router)
+from routers import analytics as analytics_router
+app.include_router(analytics_router.router)
+from routers import branches
+app.include_router(branches.router)
+from routers import api
+app.include_router(api.router)
+from routers import backups
+app.include_router(backups.router)
+from routers import classes
+app.include_router(classes.router)
+from routers import profiling
+app.include_router(profiling.router)
 app.include_router(auth.router)
 
 from fastapi import Depends, Request
 from fastapi.responses import RedirectResponse
 from typing import Optional
-from database import SessionDep
-from models import User, Payment, Attendance
+from database import SessionDep, request_branch
+from models import User, Payment
 from routers import auth
 
 @app.get("/", response_class=HTMLResponse)
@@ -57,7 +108,13 @@ async def dashboard(
         return templates.TemplateResponse(
             request=request, 
             name="client_dashboard.html", 
-            context={"user": user, "now": datetime.utcnow()}
+            context={
+                "user": user,
+                "now": datetime.utcnow(),
+                "credential": credentials.issue_for(session, request_branch(request), user.id),
+                "classes": scheduling.upcoming_for_member(session, user.id),
+                "activity": activity.stats_for(session, user.id)
+            }
         )
         
     # Admin/Staff View (Calculate Stats)
@@ -76,14 +133,26 @@ async def dashboard(
         print(f"Error calculating revenue: {e}")
         revenue = 0
     
-    # 3. Today's Attendance
+    # 3. Today's Attendance (kept live by the check-in path, no query needed)
+    branch = request_branch(request)
+    live_stats = live.counter_for(branch).snapshot()
+    attendance = live_stats["today"]
+
+    # Busiest hour over the last 4 weeks (cached per range in analytics)
     try:
-        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        attendance_query = select(func.count(Attendance.id)).where(Attendance.check_in_time >= today_start)
-        attendance = session.exec(attendance_query).one() or 0
+        import analytics
+        peak_hour = analytics.peak_hour(session)
     except Exception as e:
-        print(f"Error calculating attendance: {e}")
-        attendance = 0
+        print(f"Error calculating peak hour: {e}")
+        peak_hour = None
+
+    # Expected renewals for the next 30/60/90 days (cached until the next payment or plan change)
+    try:
+        import forecast
+        revenue_forecast = forecast.forecast_report(session)
+    except Exception as e:
+        print(f"Error calculating forecast: {e}")
+        revenue_forecast = None
 
     # Calculate Trends
     # Active Users Growth
@@ -139,6 +208,9 @@ async def dashboard(
         days.append(day_label)
         daily_revenue.append(float(rev))
 
+    # 5. Cross-branch totals (one parallel query per shard) when running several locations
+    branch_overview = await branches.all_branches_summary() if len(BRANCHES) > 1 else None
+
     return templates.TemplateResponse(
         request=request, 
         name="dashboard.html", 
@@ -150,7 +222,13 @@ async def dashboard(
             "chart_labels": days,
             "chart_data": daily_revenue,
             "active_users_growth": active_users_growth,
-            "revenue_growth": revenue_growth
+            "revenue_growth": revenue_growth,
+            "peak_hour": peak_hour,
+            "forecast": revenue_forecast,
+            "live": live_stats,
+            "branch": branch,
+            "branches": BRANCHES,
+            "branch_overview": branch_overview
         }
     )
 
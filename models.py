@@ -1,5 +1,6 @@
 from datetime import datetime
 from typing import Optional, List
+from sqlalchemy import JSON, Column, Index, UniqueConstraint
 from sqlmodel import Field, SQLModel, Relationship
 
 class UserBase(SQLModel):
@@ -41,6 +42,8 @@ class SubscriptionBase(SQLModel):
     active: bool = True
 
 class Subscription(SubscriptionBase, table=True):
+    # "Does this member have a current membership?" is a seek on this index
+    __table_args__ = (Index("ix_subscription_user_id_end_date", "user_id", "end_date"),)
     id: Optional[int] = Field(default=None, primary_key=True)
     user: User = Relationship(back_populates="subscriptions")
     plan: Plan = Relationship(back_populates="subscriptions")
@@ -51,16 +54,19 @@ class PaymentBase(SQLModel):
     date: datetime = Field(default_factory=datetime.utcnow)
     method: str  # stripe, mercadopago, cash
     status: str = "completed"
+    idempotency_key: Optional[str] = Field(default=None, unique=True, index=True)
 
 class Payment(PaymentBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     user: User = Relationship(back_populates="payments")
 
 class AttendanceBase(SQLModel):
-    user_id: int = Field(foreign_key="user.id")
-    check_in_time: datetime = Field(default_factory=datetime.utcnow)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    check_in_time: datetime = Field(default_factory=datetime.utcnow, index=True)
 
 class Attendance(AttendanceBase, table=True):
+    # Archived rows keep their id in archive.attendance, so ids must never be handed out twice
+    __table_args__ = {"sqlite_autoincrement": True}
     id: Optional[int] = Field(default=None, primary_key=True)
     user: User = Relationship(back_populates="attendances")
 
@@ -73,17 +79,157 @@ class RoutineBase(SQLModel):
 
 class Routine(RoutineBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    exercises: List["Exercise"] = Relationship(back_populates="routine")
+    exercises: List["Exercise"] = Relationship(
+        back_populates="routine",
+        sa_relationship_kwargs={"order_by": "Exercise.position"}
+    )
     users: List["User"] = Relationship(back_populates="routines", link_model=UserRoutine)
 
+class BulkAssignment(SQLModel):
+    action: str = "assign"  # assign, unassign
+    user_ids: Optional[List[int]] = None
+    plan_id: Optional[int] = None  # members whose active subscription is on this plan
+    active_only: bool = False  # members with any active subscription
+
 class ExerciseBase(SQLModel):
-    routine_id: int = Field(foreign_key="routine.id")
+    routine_id: int = Field(foreign_key="routine.id", index=True)
     name: str
     sets: int
     reps: str
     weight: Optional[str] = None
     notes: Optional[str] = None
+    position: int = 0
 
 class Exercise(ExerciseBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     routine: Routine = Relationship(back_populates="exercises")
+
+# One entry of the full, ordered exercise list sent by the routine editor
+class ExerciseItem(SQLModel):
+    id: Optional[int] = None  # omitted for new exercises
+    name: str = Field(min_length=1)
+    sets: int = Field(ge=1)
+    reps: str = Field(min_length=1)
+    weight: Optional[str] = None
+    notes: Optional[str] = None
+
+class ProfilerSettings(SQLModel):
+    enabled: bool
+    sample_rate: float = Field(default=0.01, ge=0, le=1)
+    header: bool = True  # always profile admin requests sent with "X-Profile: 1"
+
+
+# Retention cohorts (maintained incrementally by cohorts.py)
+class MemberCohort(SQLModel, table=True):
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    cohort_month: int = Field(index=True)  # months since year 0 (year * 12 + month - 1)
+    active_through: int
+    churned_month: Optional[int] = Field(default=None, index=True)
+
+class CohortStat(SQLModel, table=True):
+    cohort_month: int = Field(primary_key=True)
+    month_offset: int = Field(primary_key=True)
+    active: int = 0
+
+class MonthlyChurn(SQLModel, table=True):
+    month: int = Field(primary_key=True)
+    new: int = 0
+    churned: int = 0
+    returned: int = 0
+
+
+# Attendance archival (see archive.py): per member/month counts of rows moved to the archive db
+class AttendanceMonthly(SQLModel, table=True):
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    month: int = Field(primary_key=True)  # same month index as MemberCohort
+    visits: int = 0
+
+# Per-member check-in counters (see activity.py), updated in the check-in transaction
+class MemberActivity(SQLModel, table=True):
+    # "Most active this month" reads the first rows of this index for the current month
+    __table_args__ = (Index("ix_memberactivity_month_visits", "month", "month_visits"),)
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    total_visits: int = 0
+    # Streaks count consecutive local weeks (Monday to Sunday) with at least one visit
+    current_streak: int = 0
+    longest_streak: int = 0
+    week: int = 0  # local week of the last visit; week_visits belongs to it
+    week_visits: int = 0
+    month: int = 0  # local month of the last visit, same index as MemberCohort
+    month_visits: int = 0
+    last_check_in: Optional[datetime] = Field(default=None, index=True)
+
+class ArchiveState(SQLModel, table=True):
+    id: int = Field(default=1, primary_key=True)
+    attendance_before: Optional[datetime] = None  # every check-in older than this is archived
+
+
+# Member ledger (see ledger.py): append-only entries plus one running account row per member
+class LedgerEntry(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    payment_id: Optional[int] = Field(default=None, foreign_key="payment.id")
+    kind: str  # charge, payment
+    amount: float
+    balance_after: float
+    description: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class MemberAccount(SQLModel, table=True):
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    balance: float = 0  # positive: the member owes money
+    total_charged: float = 0
+    total_paid: float = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class Notification(SQLModel, table=True):
+    # Outbox: written in the same transaction as the change it announces, delivered later by the worker
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: Optional[int] = Field(default=None, foreign_key="user.id", index=True)
+    kind: str  # payment_received, membership_expiring, membership_expired, class_promoted
+    channel: str  # smtp, webhook
+    recipient: str
+    subject: str
+    body: str
+    dedupe_key: str = Field(unique=True)
+    status: str = Field(default="pending", index=True)  # pending, sent, failed
+    attempts: int = 0
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    sent_at: Optional[datetime] = None
+
+class ChangeEvent(SQLModel, table=True):
+    # Append-only change log; AUTOINCREMENT keeps sequence numbers increasing and never reused
+    __table_args__ = {"sqlite_autoincrement": True}
+    id: Optional[int] = Field(default=None, primary_key=True)
+    entity: str = Field(index=True)  # user, payment, subscription, attendance, plan, routine, ...
+    entity_id: Optional[int] = None
+    op: str  # create, update, delete, assign, unassign
+    data: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ChangeCursor(SQLModel, table=True):
+    consumer: str = Field(primary_key=True)
+    position: int = 0  # last ChangeEvent.id the consumer has fully processed
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ClassSession(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str
+    instructor: Optional[str] = None
+    starts_at: datetime = Field(index=True)
+    ends_at: datetime
+    capacity: int
+    # Maintained only by conditional UPDATEs in scheduling.py, never read-modify-written
+    booked: int = 0
+    waitlisted: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class Booking(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("class_id", "user_id"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    class_id: int = Field(foreign_key="classsession.id", index=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    status: str = "booked"  # booked, waitlisted, cancelled
+    created_at: datetime = Field(default_factory=datetime.utcnow)
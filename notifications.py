@@ -0,0 +1,320 @@
+import asyncio
+import json
+import os
+import random
+import smtplib
+import sys
+import urllib.request
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import Optional
+from sqlalchemy import func, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+from database import engines
+from models import Notification, Subscription, User
+
+# NOTIFY_CHANNELS="smtp,webhook"; empty disables notifications (nothing is queued)
+CHANNEL_NAMES = [name.strip() for name in os.getenv("NOTIFY_CHANNELS", "").split(",") if name.strip()]
+POLL_SECONDS = float(os.getenv("NOTIFY_POLL_SECONDS", 5))
+BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", 50))
+MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", 8))
+EXPIRING_DAYS = int(os.getenv("NOTIFY_EXPIRING_DAYS", 3))
+EXPIRY_SCAN_MINUTES = int(os.getenv("NOTIFY_EXPIRY_SCAN_MINUTES", 60))
+# A claimed batch is invisible to other workers for this long; a crash mid-delivery retries it
+LEASE_SECONDS = 120
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 6 * 3600
+
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 1025))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "false").lower() == "true"
+SMTP_FROM = os.getenv("SMTP_FROM", "Gym Manager Pro <no-reply@gym.local>")
+WEBHOOK_URL = os.getenv("NOTIFY_WEBHOOK_URL")
+WEBHOOK_TIMEOUT = 10
+
+outbox = Notification.__table__
+_wakeup: Optional[asyncio.Event] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+class SmtpChannel:
+    name = "smtp"
+
+    def deliver(self, batch: list) -> dict:
+        # One connection per batch; returns {notification id: error} for the ones that failed
+        errors = {}
+        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as smtp:
+            if SMTP_STARTTLS:
+                smtp.starttls()
+            if SMTP_USER:
+                smtp.login(SMTP_USER, SMTP_PASSWORD or "")
+            for notification in batch:
+                message = EmailMessage()
+                message["From"] = SMTP_FROM
+                message["To"] = notification.recipient
+                message["Subject"] = notification.subject
+                message.set_content(notification.body)
+                try:
+                    smtp.send_message(message)
+                except smtplib.SMTPException as e:
+                    errors[notification.id] = str(e)
+        return errors
+
+
+class WebhookChannel:
+    name = "webhook"
+
+    def deliver(self, batch: list) -> dict:
+        # The whole batch goes in one POST; any non-2xx response retries all of it
+        payload = [
+            {
+                "id": n.id,
+                "kind": n.kind,
+                "user_id": n.user_id,
+                "recipient": n.recipient,
+                "subject": n.subject,
+                "body": n.body,
+                "created_at": n.created_at.isoformat(),
+            }
+            for n in batch
+        ]
+        request = urllib.request.Request(
+            WEBHOOK_URL,
+            data=json.dumps({"notifications": payload}).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=WEBHOOK_TIMEOUT):
+            pass
+        return {}
+
+
+CHANNELS = {channel.name: channel for channel in (SmtpChannel(), WebhookChannel())}
+
+
+def _enqueue(session: Session, user: User, kind: str, key: str, subject: str, body: str):
+    # Part of the caller's transaction; the dedupe key makes repeated events a no-op
+    for channel in CHANNEL_NAMES:
+        session.execute(
+            sqlite_insert(outbox).values(
+                user_id=user.id,
+                kind=kind,
+                channel=channel,
+                recipient=user.email,
+                subject=subject,
+                body=body,
+                dedupe_key=f"{key}:{channel}",
+                status="pending",
+                attempts=0,
+                next_attempt_at=datetime.utcnow(),
+                created_at=datetime.utcnow(),
+            ).on_conflict_do_nothing(index_elements=["dedupe_key"])
+        )
+
+
+def payment_received(session: Session, user: User, payment, subscription: Subscription, plan_name: str):
+    _enqueue(
+        session, user, "payment_received", f"payment:{payment.id}",
+        "Recibimos tu pago",
+        f"Hola {user.name},\n\nRegistramos tu pago de ${payment.amount:,.2f} por el plan {plan_name}.\n"
+        f"Tu membresía queda activa hasta el {subscription.end_date:%d/%m/%Y}.\n\nGym Manager Pro",
+    )
+
+
+def class_promoted(session: Session, user: User, class_session, booking):
+    # A cancelled booking is reused with a new created_at, so each promotion gets its own key
+    _enqueue(
+        session, user, "class_promoted", f"class_promoted:{booking.id}:{booking.created_at:%Y%m%d%H%M%S%f}",
+        "Tenés lugar en la clase",
+        f"Hola {user.name},\n\nSe liberó un lugar y tu reserva para {class_session.name} del "
+        f"{class_session.starts_at:%d/%m/%Y %H:%M} quedó confirmada.\n\nGym Manager Pro",
+    )
+
+
+def enqueue_expiry_notices(session: Session, now: Optional[datetime] = None) -> int:
+    # Members whose latest subscription ends within EXPIRING_DAYS, or ended in the last week
+    now = now or datetime.utcnow()
+    latest = (
+        select(Subscription.user_id, func.max(Subscription.end_date).label("end_date"))
+        .group_by(Subscription.user_id)
+        .subquery()
+    )
+    rows = session.exec(
+        select(User, latest.c.end_date)
+        .join(latest, latest.c.user_id == User.id)
+        .where(
+            latest.c.end_date > now - timedelta(days=7),
+            latest.c.end_date <= now + timedelta(days=EXPIRING_DAYS),
+        )
+    ).all()
+
+    for user, end_date in rows:
+        if end_date > now:
+            _enqueue(
+                session, user, "membership_expiring", f"expiring:{user.id}:{end_date:%Y%m%d}",
+                "Tu membresía vence pronto",
+                f"Hola {user.name},\n\nTu membresía vence el {end_date:%d/%m/%Y}. "
+                "Renovala en recepción para seguir entrenando sin interrupciones.\n\nGym Manager Pro",
+            )
+        else:
+            _enqueue(
+                session, user, "membership_expired", f"expired:{user.id}:{end_date:%Y%m%d}",
+                "Tu membresía venció",
+                f"Hola {user.name},\n\nTu membresía venció el {end_date:%d/%m/%Y}. "
+                "Te esperamos en recepción para renovarla.\n\nGym Manager Pro",
+            )
+    session.commit()
+    return len(rows)
+
+
+def _claim(session: Session, now: datetime) -> list:
+    # UPDATE ... RETURNING pushes the batch's next attempt past the lease in one statement,
+    # so two workers never deliver the same rows concurrently
+    due = (
+        select(Notification.id)
+        .where(Notification.status == "pending", Notification.next_attempt_at <= now)
+        .order_by(Notification.id)
+        .limit(BATCH_SIZE)
+    )
+    claimed = session.execute(
+        update(Notification)
+        .where(Notification.id.in_(due.scalar_subquery()))
+        .values(next_attempt_at=now + timedelta(seconds=LEASE_SECONDS))
+        .returning(Notification.id)
+    ).scalars().all()
+    session.commit()
+    if not claimed:
+        return []
+    return session.exec(select(Notification).where(Notification.id.in_(claimed))).all()
+
+
+def _backoff(attempts: int) -> timedelta:
+    delay = min(BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), BACKOFF_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def _record_results(session: Session, batch: list, errors: dict, now: datetime):
+    for notification in batch:
+        error = errors.get(notification.id)
+        notification.attempts += 1
+        if error is None:
+            notification.status = "sent"
+            notification.sent_at = now
+            notification.last_error = None
+        else:
+            notification.last_error = error[:500]
+            if notification.attempts >= MAX_ATTEMPTS:
+                notification.status = "failed"
+            else:
+                notification.next_attempt_at = now + _backoff(notification.attempts)
+        session.add(notification)
+    session.commit()
+
+
+def drain(engine, now: Optional[datetime] = None) -> int:
+    # Delivers due notifications of one shard, batch by batch; returns how many were sent
+    sent = 0
+    with Session(engine) as session:
+        while True:
+            batch_time = now or datetime.utcnow()
+            batch = _claim(session, batch_time)
+            if not batch:
+                return sent
+            by_channel = {}
+            for notification in batch:
+                by_channel.setdefault(notification.channel, []).append(notification)
+            errors = {}
+            for name, notifications in by_channel.items():
+                channel = CHANNELS.get(name)
+                try:
+                    if channel is None:
+                        raise ValueError(f"Canal desconocido: {name}")
+                    errors.update(channel.deliver(notifications))
+                except Exception as e:
+                    errors.update({n.id: f"{type(e).__name__}: {e}" for n in notifications})
+            _record_results(session, batch, errors, batch_time)
+            sent += len(batch) - len(errors)
+            if len(batch) < BATCH_SIZE:
+                return sent
+
+
+def wake():
+    # Called after a commit that queued notifications; delivery never runs in the request.
+    # Safe from worker threads too: the event is only ever set on its own loop.
+    if _wakeup is not None:
+        _loop.call_soon_threadsafe(_wakeup.set)
+
+
+async def worker_loop():
+    global _wakeup, _loop
+    _loop = asyncio.get_running_loop()
+    _wakeup = asyncio.Event()
+    last_scan = None
+    while True:
+        try:
+            if CHANNEL_NAMES and (last_scan is None or datetime.utcnow() - last_scan >= timedelta(minutes=EXPIRY_SCAN_MINUTES)):
+                last_scan = datetime.utcnow()
+                for engine in engines.values():
+                    await asyncio.to_thread(_scan_expiry, engine)
+            for engine in engines.values():
+                await asyncio.to_thread(drain, engine)
+        except Exception as e:
+            print(f"Error delivering notifications: {e}")
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+
+
+def _scan_expiry(engine):
+    with Session(engine) as session:
+        enqueue_expiry_notices(session)
+
+
+async def _debug_smtp_session(reader, writer):
+    # Minimal SMTP sink for development: accepts every message and prints it
+    writer.write(b"220 gym-debug-smtp\r\n")
+    in_data, lines = False, []
+    while line := await reader.readline():
+        if in_data:
+            if line in (b".\r\n", b".\n"):
+                in_data = False
+                print("-" * 60 + "\n" + b"".join(lines).decode(errors="replace"), flush=True)
+                lines = []
+                writer.write(b"250 OK\r\n")
+                await writer.drain()
+            else:
+                lines.append(line[1:] if line.startswith(b"..") else line)
+            continue
+        command = line[:4].upper()
+        if command in (b"HELO", b"EHLO"):
+            writer.write(b"250 gym-debug-smtp\r\n")
+        elif command == b"DATA":
+            in_data = True
+            writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+        elif command == b"QUIT":
+            writer.write(b"221 Bye\r\n")
+            break
+        else:
+            writer.write(b"250 OK\r\n")
+        await writer.drain()
+    writer.close()
+
+
+async def debug_smtp_server(host: str = "localhost", port: int = SMTP_PORT):
+    server = await asyncio.start_server(_debug_smtp_session, host, port)
+    print(f"Debug SMTP server listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    # python notifications.py debug-smtp
+    if sys.argv[1:] == ["debug-smtp"]:
+        asyncio.run(debug_smtp_server())
+    else:
+        print("Usage: python notifications.py debug-smtp")
@@ -0,0 +1,214 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+import jinja2
+import jwt
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.requests import HTTPConnection
+from routers.auth import SECRET_KEY, ALGORITHM
+
+# Off by default; an admin turns it on at runtime through /profiling/settings.
+# While off, the middleware and the hooks below cost one attribute or ContextVar read.
+settings = {
+    "enabled": os.getenv("PROFILE_ENABLED", "false").lower() == "true",
+    "sample_rate": float(os.getenv("PROFILE_SAMPLE_RATE", 0.01)),
+    # Admin requests sent with "X-Profile: 1" are always profiled while enabled
+    "header": True,
+}
+PROFILE_HEADER = b"x-profile"
+INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_MS", 5)) / 1000
+REPORTS_PER_ROUTE = 20
+MAX_STACK_DEPTH = 64
+
+reports: dict = {}
+current: ContextVar[Optional["Profile"]] = ContextVar("profile", default=None)
+
+
+class Profile:
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started_at = datetime.utcnow()
+        self.sql_ms = 0.0
+        self.sql_count = 0
+        self.template_ms = 0.0
+        self.rendering = False
+        # Queries issued while a template renders are relationship lazy loads
+        self.lazy_sql_ms = 0.0
+        self.lazy_sql_count = 0
+        self.slowest_sql = []
+        self.stacks = Counter()
+        self.samples = 0
+
+    def add_sql(self, elapsed_ms: float, statement: str):
+        self.sql_ms += elapsed_ms
+        self.sql_count += 1
+        if self.rendering:
+            self.lazy_sql_ms += elapsed_ms
+            self.lazy_sql_count += 1
+        self.slowest_sql.append((elapsed_ms, " ".join(statement.split())[:300]))
+        self.slowest_sql = sorted(self.slowest_sql, reverse=True)[:5]
+
+
+class Sampler(threading.Thread):
+    # Statistical profiler: records the target thread's stack every INTERVAL_SECONDS.
+    # Async handlers run on the event loop thread, so overlapping requests on the same
+    # loop can show up in each other's samples; the SQL and template timings are exact.
+    def __init__(self, profile: Profile, thread_id: int):
+        super().__init__(daemon=True)
+        self.profile = profile
+        self.thread_id = thread_id
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(INTERVAL_SECONDS):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.profile.stacks[";".join(reversed(stack))] += 1
+                self.profile.samples += 1
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if current.get() is not None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current.get()
+    if profile is not None and conn.info.get("profile_started"):
+        profile.add_sql((time.perf_counter() - conn.info["profile_started"].pop()) * 1000, statement)
+
+
+# Every router builds its own Jinja2Templates, so rendering is timed at the Template class
+_render = jinja2.Template.render
+
+def _timed_render(self, *args, **kwargs):
+    profile = current.get()
+    if profile is None or profile.rendering:
+        return _render(self, *args, **kwargs)
+    profile.rendering = True
+    started = time.perf_counter()
+    try:
+        return _render(self, *args, **kwargs)
+    finally:
+        profile.template_ms += (time.perf_counter() - started) * 1000
+        profile.rendering = False
+
+jinja2.Template.render = _timed_render
+
+
+def _admin_session(scope) -> bool:
+    token = HTTPConnection(scope).cookies.get("access_token")
+    if not token:
+        return False
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("role") == "admin"
+    except jwt.PyJWTError:
+        return False
+
+
+def _requested(scope) -> bool:
+    # The header forces a sampler thread and exposes timings, so it only counts for admin sessions
+    return (
+        settings["header"]
+        and any(name == PROFILE_HEADER and value not in (b"", b"0") for name, value in scope["headers"])
+        and _admin_session(scope)
+    )
+
+
+def _store(profile: Profile, route: str, duration_ms: float):
+    report = {
+        "route": route,
+        "path": profile.path,
+        "started_at": profile.started_at.isoformat(timespec="seconds"),
+        "duration_ms": round(duration_ms, 2),
+        "sql_ms": round(profile.sql_ms, 2),
+        "sql_count": profile.sql_count,
+        "lazy_sql_ms": round(profile.lazy_sql_ms, 2),
+        "lazy_sql_count": profile.lazy_sql_count,
+        # Template time includes the lazy loads it triggered; "other" is Python outside both
+        "template_ms": round(profile.template_ms - profile.lazy_sql_ms, 2),
+        "other_ms": round(max(0.0, duration_ms - profile.sql_ms - (profile.template_ms - profile.lazy_sql_ms)), 2),
+        "samples": profile.samples,
+        "slowest_sql": [{"ms": round(ms, 2), "statement": sql} for ms, sql in profile.slowest_sql],
+        "stacks": profile.stacks,
+    }
+    reports.setdefault(route, deque(maxlen=REPORTS_PER_ROUTE)).append(report)
+
+
+def summary() -> list:
+    # Per route averages over the stored reports, slowest first
+    rows = []
+    for route, route_reports in reports.items():
+        n = len(route_reports)
+        rows.append({
+            "route": route,
+            "profiled": n,
+            **{
+                key: round(sum(r[key] for r in route_reports) / n, 2)
+                for key in ("duration_ms", "sql_ms", "sql_count", "lazy_sql_count", "template_ms", "other_ms")
+            },
+            "recent": [{k: v for k, v in r.items() if k != "stacks"} for r in list(route_reports)[-5:]],
+        })
+    return sorted(rows, key=lambda row: row["duration_ms"], reverse=True)
+
+
+def folded(route: str) -> str:
+    # Collapsed stacks ("frame;frame;frame count"), the input format of flamegraph.pl and speedscope
+    stacks = Counter()
+    for report in reports.get(route, ()):
+        stacks.update(report["stacks"])
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+
+
+class ProfilerMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not settings["enabled"] or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # Only explicitly requested profiles get a Server-Timing header; random samples stay internal
+        requested = _requested(scope)
+        if not requested and random.random() >= settings["sample_rate"]:
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"])
+        token = current.set(profile)
+        sampler = Sampler(profile, threading.get_ident())
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if requested and message["type"] == "http.response.start":
+                timing = (
+                    f"sql;dur={profile.sql_ms:.1f};desc=\"{profile.sql_count} queries\", "
+                    f"tpl;dur={profile.template_ms:.1f}, app;dur={(time.perf_counter() - started) * 1000:.1f}"
+                )
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", timing.encode())]}
+            await send(message)
+
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            sampler.done.set()
+            current.reset(token)
+            route = scope.get("route")
+            name = f"{scope['method']} {route.path if route is not None else scope['path']}"
+            _store(profile, name, (time.perf_counter() - started) * 1000)
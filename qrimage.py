@@ -0,0 +1,32 @@
+import io
+import os
+from collections import OrderedDict
+
+import segno
+
+MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+# Rendered images keyed by (payload, format); a new payload is a new key, so rotated
+# or regenerated codes never serve a stale image and old ones age out of the LRU
+CACHE_SIZE = int(os.getenv("QR_CACHE_SIZE", 512))
+SCALE = 5
+BORDER = 2
+
+_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+
+def render(payload: str, kind: str) -> bytes:
+    key = (payload, kind)
+    image = _cache.get(key)
+    if image is not None:
+        _cache.move_to_end(key)
+        return image
+
+    buffer = io.BytesIO()
+    options = {"xmldecl": False} if kind == "svg" else {}
+    segno.make(payload, error="m").save(buffer, kind=kind, scale=SCALE, border=BORDER, **options)
+    image = buffer.getvalue()
+
+    _cache[key] = image
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return image
@@ -0,0 +1,87 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+
+# Buckets kept per limiter; the least recently seen key is evicted beyond this
+MAX_TRACKED_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 10000))
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float, message: str, status_code: int = 429):
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.message = message
+        self.status_code = status_code
+
+
+class TokenBucketLimiter:
+    def __init__(self, per_minute: float, burst: int, max_keys: int = MAX_TRACKED_KEYS):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def hit(self, key: str) -> float:
+        # Takes one token for key; returns 0 if allowed, otherwise seconds until the next token
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = [float(self.burst), now]
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+    def check(self, key: str, message: str = "Demasiados intentos, intentá de nuevo en unos segundos"):
+        retry_after = self.hit(key)
+        if retry_after:
+            raise RateLimited(retry_after, message)
+
+
+class ConcurrencyLimiter:
+    # Bounds work in flight; once max_waiting callers are queued, new ones are shed immediately
+    def __init__(self, limit: int, max_waiting: int, timeout: float):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.waiting = 0
+
+    async def __aenter__(self):
+        if self.semaphore.locked() and self.waiting >= self.max_waiting:
+            raise RateLimited(self.timeout, "Servidor ocupado, intentá de nuevo en unos segundos", 503)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise RateLimited(self.timeout, "Servidor ocupado, intentá de nuevo en unos segundos", 503)
+        finally:
+            self.waiting -= 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.semaphore.release()
+
+
+def client_ip(request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+# Login: Argon2 verification is deliberately expensive, so guard IP, account and total CPU
+login_by_ip = TokenBucketLimiter(per_minute=int(os.getenv("LOGIN_PER_MINUTE_IP", 20)), burst=10)
+login_by_account = TokenBucketLimiter(per_minute=int(os.getenv("LOGIN_PER_MINUTE_ACCOUNT", 6)), burst=5)
+login_gate = ConcurrencyLimiter(limit=os.cpu_count() or 2, max_waiting=16, timeout=5)
+
+# Check-in: a looping scanner is throttled per IP, per device and per scanned code (member)
+checkin_by_ip = TokenBucketLimiter(per_minute=int(os.getenv("CHECKIN_PER_MINUTE_IP", 120)), burst=20)
+checkin_by_device = TokenBucketLimiter(per_minute=int(os.getenv("CHECKIN_PER_MINUTE_DEVICE", 60)), burst=10)
+checkin_by_code = TokenBucketLimiter(per_minute=6, burst=2)
+checkin_gate = ConcurrencyLimiter(limit=8, max_waiting=32, timeout=2)
@@ -0,0 +1,102 @@
+from fastapi import APIRouter, Request, Depends, HTTPException, Query
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.templating import Jinja2Templates
+from database import SessionDep
+from datetime import date, timedelta
+from typing import Optional
+import assets
+import activity
+import analytics
+import cohorts
+import forecast
+import scheduling
+
+from routers.auth import admin_required
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+templates = Jinja2Templates(directory="templates")
+assets.install(templates)
+templates.env.filters["local"] = scheduling.to_local
+
+MAX_RANGE_DAYS = 366
+
+@router.get("/occupancy")
+async def occupancy(
+    session: SessionDep,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    window: int = Query(7, ge=1, le=90),
+    current_user: dict = Depends(admin_required)
+):
+    end = end or date.today()
+    start = start or end - timedelta(days=27)
+    if start > end:
+        raise HTTPException(status_code=400, detail="La fecha de inicio debe ser anterior a la de fin")
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"El rango no puede superar {MAX_RANGE_DAYS} días")
+
+    return JSONResponse(content=analytics.occupancy_report(session, start, end, window))
+
+@router.get("/forecast")
+async def revenue_forecast(
+    session: SessionDep,
+    current_user: dict = Depends(admin_required)
+):
+    return JSONResponse(content=forecast.forecast_report(session))
+
+@router.get("/cohorts/data")
+async def cohort_data(
+    session: SessionDep,
+    months: int = Query(12, ge=1, le=60),
+    current_user: dict = Depends(admin_required)
+):
+    cohorts.sweep_expired(session)
+    return JSONResponse(content=cohorts.cohort_report(session, months))
+
+@router.get("/cohorts", response_class=HTMLResponse)
+async def cohort_page(
+    request: Request,
+    session: SessionDep,
+    months: int = Query(12, ge=1, le=60),
+    current_user: dict = Depends(admin_required)
+):
+    cohorts.sweep_expired(session)
+    return templates.TemplateResponse(
+        request=request,
+        name="analytics/cohorts.html",
+        context={"report": cohorts.cohort_report(session, months), "months": months, "user": current_user}
+    )
+
+@router.post("/cohorts/rebuild")
+async def rebuild_cohorts(
+    session: SessionDep,
+    current_user: dict = Depends(admin_required)
+):
+    cohorts.rebuild(session)
+    return RedirectResponse(url="/analytics/cohorts", status_code=303)
+
+@router.get("/activity", response_class=HTMLResponse)
+async def activity_page(
+    request: Request,
+    session: SessionDep,
+    limit: int = Query(activity.TOP_N, ge=1, le=100),
+    current_user: dict = Depends(admin_required)
+):
+    return templates.TemplateResponse(
+        request=request,
+        name="analytics/activity.html",
+        context={
+            "most_active": activity.most_active(session, limit),
+            "least_active": activity.least_active(session, limit),
+            "limit": limit,
+            "user": current_user
+        }
+    )
+
+@router.post("/activity/rebuild")
+async def rebuild_activity(
+    session: SessionDep,
+    current_user: dict = Depends(admin_required)
+):
+    activity.rebuild(session)
+    return RedirectResponse(url="/analytics/activity", status_code=303)
@@ -0,0 +1,286 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
+from sqlmodel import select
+from database import SessionDep
+from models import User, Plan, Subscription, Routine, Exercise, UserRoutine, ChangeEvent, ClassSession, Booking
+from datetime import datetime
+from typing import Optional
+import archive
+import base64
+import scheduling
+
+from routers.auth import get_current_user, admin_required
+
+# Data-only surface for the scanner tablet, the member PWA and other clients.
+# Rows are selected column by column and never materialized as ORM objects,
+# so serialization can't trigger relationship lazy loads.
+router = APIRouter(prefix="/api/v1", tags=["api"], default_response_class=ORJSONResponse)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Public fields per resource (anything else, e.g. hashed_password, is never exposed)
+MEMBER_FIELDS = ("id", "name", "email", "role", "created_at")
+PLAN_FIELDS = ("id", "name", "price", "duration_days", "description")
+SUBSCRIPTION_FIELDS = ("id", "user_id", "plan_id", "start_date", "end_date", "active")
+ATTENDANCE_FIELDS = ("id", "user_id", "check_in_time")
+ROUTINE_FIELDS = ("id", "name", "description", "frequency", "created_at")
+EXERCISE_FIELDS = ("id", "name", "sets", "reps", "weight", "notes", "position")
+CHANGE_FIELDS = ("id", "entity", "entity_id", "op", "data", "created_at")
+CLASS_FIELDS = ("id", "name", "instructor", "starts_at", "ends_at", "capacity", "booked", "waitlisted")
+BOOKING_FIELDS = ("id", "class_id", "user_id", "status", "created_at")
+
+async def member_required(user: Optional[User] = Depends(get_current_user)):
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No autenticado")
+    return user
+
+def _check_access(current_user: User, user_id: int):
+    if current_user.role != "admin" and current_user.id != user_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acceso denegado")
+
+def _columns(model, allowed: tuple, fields: Optional[str]):
+    # Sparse fieldsets: ?fields=name,email. The id is always included (it is the cursor)
+    if not fields:
+        names = allowed
+    else:
+        names = tuple(dict.fromkeys(["id"] + [f.strip() for f in fields.split(",") if f.strip()]))
+        unknown = [name for name in names if name not in allowed]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Campos desconocidos: {', '.join(unknown)}")
+    return [getattr(model, name) for name in names]
+
+def _encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode()
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    if not cursor:
+        return None
+    try:
+        prefix, _, value = base64.urlsafe_b64decode(cursor.encode()).decode().partition(":")
+        if prefix != "id":
+            raise ValueError(cursor)
+        return int(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def _page(session, model, columns, conditions=(), cursor=None, limit=DEFAULT_PAGE_SIZE) -> dict:
+    # Keyset pagination on the primary key: stable under inserts and O(limit) at any depth
+    after = _decode_cursor(cursor)
+    statement = select(*columns).where(*conditions)
+    if after is not None:
+        statement = statement.where(model.id > after)
+    rows = session.exec(statement.order_by(model.id).limit(limit + 1)).all()
+    data = [dict(row._mapping) for row in rows[:limit]]
+    next_cursor = _encode_cursor(data[-1]["id"]) if len(rows) > limit else None
+    return {"data": data, "next_cursor": next_cursor}
+
+def _one(session, columns, *conditions) -> dict:
+    row = session.exec(select(*columns).where(*conditions)).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="No encontrado")
+    return dict(row._mapping)
+
+PageSize = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+
+# Members
+@router.get("/members")
+async def list_members(
+    session: SessionDep,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = PageSize,
+    role: Optional[str] = None,
+    current_user: User = Depends(admin_required)
+):
+    conditions = [User.role == role] if role else []
+    return _page(session, User, _columns(User, MEMBER_FIELDS, fields), conditions, cursor, limit)
+
+@router.get("/members/me")
+async def get_me(
+    session: SessionDep,
+    fields: Optional[str] = None,
+    current_user: User = Depends(member_required)
+):
+    return _one(session, _columns(User, MEMBER_FIELDS, fields), User.id == current_user.id)
+
+@router.get("/members/{user_id}")
+async def get_member(
+    user_id: int,
+    session: SessionDep,
+    fields: Optional[str] = None,
+    current_user: User = Depends(member_required)
+):
+    _check_access(current_user, user_id)
+    return _one(session, _columns(User, MEMBER_FIELDS, fields), User.id == user_id)
+
+@router.get("/members/{user_id}/subscriptions")
+async def list_member_subscriptions(
+    user_id: int,
+    session: SessionDep,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = PageSize,
+    current_user: User = Depends(member_required)
+):
+    _check_access(current_user, user_id)
+    columns = _columns(Subscription, SUBSCRIPTION_FIELDS, fields)
+    return _page(session, Subscription, columns, [Subscription.user_id == user_id], cursor, limit)
+
+@router.get("/members/{user_id}/attendance")
+async def list_member_attendance(
+    user_id: int,
+    session: SessionDep,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = PageSize,
+    current_user: User = Depends(member_required)
+):
+    _check_access(current_user, user_id)
+    attendance = archive.attendance_source(session).c
+    columns = _columns(attendance, ATTENDANCE_FIELDS, fields)
+    return _page(session, attendance, columns, [attendance.user_id == user_id], cursor, limit)
+
+# Plans
+@router.get("/plans")
+async def list_plans(
+    session: SessionDep,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = PageSize,
+    current_user: User = Depends(member_required)
+):
+    return _page(session, Plan, _columns(Plan, PLAN_FIELDS, fields), (), cursor, limit)
+
+# Subscriptions
+@router.get("/subscriptions")
+async def list_subscriptions(
+    session: SessionDep,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = PageSize,
+    active: Optional[bool] = None,
+    current_user: User = Depends(admin_required)
+):
+    conditions = []
+    if active is not None:
+        now = datetime.utcnow()
+        conditions.append((Subscription.end_date > now) if active else (Subscription.end_date <= now))
+    columns = _columns(Subscription, SUBSCRIPTION_FIELDS, fields)
+    return _page(session, Subscription, columns, conditions, cursor, limit)
+
+# Attendance
+@router.get("/attendance")
+async def list_attendance(
+    session: SessionDep,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = PageSize,
+    since: Optional[datetime] = None,
+    current_user: User = Depends(admin_required)
+):
+    # Archived check-ins are included whenever the range reaches back past the archive watermark
+    attendance = archive.attendance_source(session, since).c
+    conditions = [attendance.check_in_time >= since] if since else []
+    columns = _columns(attendance, ATTENDANCE_FIELDS, fields)
+    return _page(session, attendance, columns, conditions, cursor, limit)
+
+# Routines (members only see the ones assigned to them)
+@router.get("/routines")
+async def list_routines(
+    session: SessionDep,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = PageSize,
+    current_user: User = Depends(member_required)
+):
+    conditions = []
+    if current_user.role != "admin":
+        assigned = select(UserRoutine.routine_id).where(UserRoutine.user_id == current_user.id)
+        conditions.append(Routine.id.in_(assigned))
+    return _page(session, Routine, _columns(Routine, ROUTINE_FIELDS, fields), conditions, cursor, limit)
+
+@router.get("/routines/{routine_id}")
+async def get_routine(
+    routine_id: int,
+    session: SessionDep,
+    fields: Optional[str] = None,
+    current_user: User = Depends(member_required)
+):
+    if current_user.role != "admin" and not session.get(UserRoutine, (current_user.id, routine_id)):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acceso denegado")
+    routine = _one(session, _columns(Routine, ROUTINE_FIELDS, fields), Routine.id == routine_id)
+    exercises = session.exec(
+        select(*[getattr(Exercise, name) for name in EXERCISE_FIELDS])
+        .where(Exercise.routine_id == routine_id)
+        .order_by(Exercise.position)
+    ).all()
+    routine["exercises"] = [dict(row._mapping) for row in exercises]
+    return routine
+
+# Classes and bookings
+@router.get("/classes")
+async def list_classes(
+    session: SessionDep,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = PageSize,
+    current_user: User = Depends(member_required)
+):
+    columns = _columns(ClassSession, CLASS_FIELDS, fields)
+    return _page(session, ClassSession, columns, [ClassSession.starts_at > datetime.utcnow()], cursor, limit)
+
+@router.get("/members/{user_id}/bookings")
+async def list_member_bookings(
+    user_id: int,
+    session: SessionDep,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = PageSize,
+    current_user: User = Depends(member_required)
+):
+    _check_access(current_user, user_id)
+    conditions = [Booking.user_id == user_id, Booking.status != "cancelled"]
+    return _page(session, Booking, _columns(Booking, BOOKING_FIELDS, fields), conditions, cursor, limit)
+
+@router.post("/classes/{class_id}/bookings")
+async def book_class(
+    class_id: int,
+    session: SessionDep,
+    current_user: User = Depends(member_required)
+):
+    try:
+        result = await run_in_threadpool(scheduling.book, session, class_id, current_user.id)
+    except scheduling.BookingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    return ORJSONResponse(content=result, status_code=201 if result["created"] else 200)
+
+@router.delete("/classes/{class_id}/bookings/me")
+async def cancel_booking(
+    class_id: int,
+    session: SessionDep,
+    current_user: User = Depends(member_required)
+):
+    try:
+        return await run_in_threadpool(scheduling.cancel, session, class_id, current_user.id)
+    except scheduling.BookingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+# Change log: external consumers keep next_cursor and resume from it
+@router.get("/changes")
+async def list_changes(
+    session: SessionDep,
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = PageSize,
+    entity: Optional[str] = None,
+    current_user: User = Depends(admin_required)
+):
+    conditions = [ChangeEvent.entity == entity] if entity else []
+    columns = _columns(ChangeEvent, CHANGE_FIELDS, fields)
+    page = _page(session, ChangeEvent, columns, conditions, cursor, limit)
+    # The log never ends: at the tail, hand back a cursor to poll from instead of null
+    if page["next_cursor"] is None:
+        page["next_cursor"] = _encode_cursor(page["data"][-1]["id"]) if page["data"] else cursor
+    return page
@@ -1,16 +1,31 @@
 from fastapi import APIRouter, Request, Form, Depends, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlmodel import Session, select
-from database import SessionDep
+from database import SessionDep, BRANCHES, get_engine, request_branch
 from models import User, Attendance
-from datetime import datetime
+from datetime import datetime, date
+import assets
+import activity
+import analytics
+import asyncio
+import changelog
+import live
+import credentials
+import directory
+import ratelimit
 
-from routers.auth import get_current_user
+from routers.auth import get_current_user, admin_required
 from typing import Optional
+from anyio import from_thread
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter(tags=["attendance"])
 templates = Jinja2Templates(directory="templates")
+assets.install(templates)
+
+# Idle streams re-send a snapshot so the occupancy estimate decays and proxies keep the connection open
+LIVE_KEEPALIVE_SECONDS = 30
 
 @router.get("/scan", response_class=HTMLResponse)
 async def scan_page(
@@ -25,28 +40,131 @@ async def scan_page(
 
 @router.post("/attendance/checkin")
 async def checkin(
+    request: Request,
     session: SessionDep,
     qr_code: str = Form(...)
 ):
+    branch = request_branch(request)
+    # The device id is chosen by the client, so the IP bucket applies whether or not it is sent
+    ratelimit.checkin_by_ip.check(ratelimit.client_ip(request))
+    device_id = request.headers.get("x-device-id")
+    if device_id:
+        ratelimit.checkin_by_device.check(device_id)
+
+    # Signed credentials are verified with an HMAC and name their home shard; plain UUIDs
+    # (cards printed before rotation) still go through the lookup below
+    credential = None
+    if credentials.is_signed(qr_code):
+        credential = credentials.verify(qr_code)
+        if not credential or credential.branch not in BRANCHES:
+            return JSONResponse(
+                status_code=403,
+                content={"status": "error", "message": "Código QR vencido o inválido"}
+            )
+    scan_key = f"{credential.branch}:{credential.user_id}" if credential else qr_code
+    ratelimit.checkin_by_code.check(scan_key, "Este código ya fue escaneado, esperá unos segundos")
+
+    # The SQLite work runs in a worker thread, so the gate really bounds check-ins in flight
+    async with ratelimit.checkin_gate:
+        return await run_in_threadpool(find_and_record, session, qr_code, credential, branch)
+
+def find_and_record(session: Session, qr_code: str, credential: Optional[credentials.Credential], branch: str):
+    if credential:
+        if credential.branch == branch:
+            return checkin_credential(session, credential, branch)
+        with Session(get_engine(credential.branch)) as home_session:
+            return checkin_credential(home_session, credential, branch)
+
     # Find user by QR code
     statement = select(User).where(User.qr_code_data == qr_code)
     user = session.exec(statement).first()
-    
+    if user:
+        return record_checkin(session, user, home_branch=branch, branch=branch)
+
+    # Member of another branch: the visit is stored in their home shard
+    entry = directory.lookup(qr_code)
+    if entry and entry["branch"] != branch:
+        with Session(get_engine(entry["branch"])) as home_session:
+            user = home_session.get(User, entry["user_id"])
+            if user and user.qr_code_data == qr_code:
+                return record_checkin(home_session, user, home_branch=entry["branch"], branch=branch)
+
+    return JSONResponse(
+        status_code=404, 
+        content={"status": "error", "message": "Usuario no encontrado"}
+    )
+
+def checkin_credential(session: Session, credential: credentials.Credential, branch: str):
+    user = session.get(User, credential.user_id)
     if not user:
         return JSONResponse(
             status_code=404, 
             content={"status": "error", "message": "Usuario no encontrado"}
         )
+    return record_checkin(session, user, home_branch=credential.branch, branch=branch, membership_active=credential.active)
 
+def record_checkin(session: Session, user: User, home_branch: str, branch: str, membership_active: bool = True):
     # Record attendance
     attendance = Attendance(user_id=user.id)
     session.add(attendance)
+    session.flush()
+    changelog.record(session, "attendance", attendance.id, "create", {
+        **changelog.snapshot(attendance, "user_id", "check_in_time"), "branch": branch
+    })
+    activity.record_visit(session, user.id, attendance.check_in_time)
     session.commit()
-    
+    # Called from a worker thread; the caches and the live counter's SSE queues belong to the event loop
+    from_thread.run_sync(publish_checkin, branch, user.name, attendance.check_in_time)
+
+    message = f"Bienvenido, {user.name}!"
+    if home_branch != branch:
+        message += f" (socio de {BRANCHES[home_branch].name})"
+    if not membership_active:
+        message += " Tu membresía está vencida."
     return JSONResponse(
         content={
             "status": "success", 
-            "message": f"Bienvenido, {user.name}!",
+            "message": message,
             "time": datetime.now().strftime("%H:%M")
         }
     )
+
+def publish_checkin(branch: str, name: str, check_in_time: datetime):
+    analytics.invalidate_cache(since=date.today())
+    live.counter_for(branch).record(name, check_in_time)
+
+@router.get("/attendance/credential")
+async def my_credential(
+    request: Request,
+    session: SessionDep,
+    current_user: Optional[User] = Depends(get_current_user)
+):
+    if not current_user:
+        raise HTTPException(status_code=401, detail="No autenticado")
+    return credentials.issue_for(session, request_branch(request), current_user.id)
+
+@router.get("/attendance/live")
+async def live_stream(
+    request: Request,
+    current_user: dict = Depends(admin_required)
+):
+    counter = live.counter_for(request_branch(request))
+
+    async def event_stream():
+        queue = counter.subscribe()
+        try:
+            yield live.format_sse("snapshot", counter.snapshot())
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=LIVE_KEEPALIVE_SECONDS)
+                    yield live.format_sse(event["type"], event)
+                except asyncio.TimeoutError:
+                    yield live.format_sse("snapshot", counter.snapshot())
+        finally:
+            counter.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
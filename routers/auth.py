@@ -2,13 +2,18 @@ from fastapi import APIRouter, Request, Form, Depends, HTTPException, status
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from sqlmodel import Session, select
-from database import SessionDep
+from database import SessionDep, request_branch, get_engine, DEFAULT_BRANCH
 from models import User
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from typing import Optional
+import assets
 import jwt
 import os
+import changelog
+import directory
+import ratelimit
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -24,6 +29,7 @@ pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 templates = Jinja2Templates(directory="templates")
+assets.install(templates)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -48,6 +54,14 @@ async def get_current_user(request: Request, session: SessionDep):
         user_id = payload.get("sub")
         if not user_id:
             return None
+        # User ids are per branch shard: a token is only valid on the branch that issued it,
+        # except admins, who map to the admin account with the same email on other branches
+        if payload.get("branch", DEFAULT_BRANCH) != request_branch(request):
+            if payload.get("role") != "admin" or not payload.get("email"):
+                return None
+            return session.exec(
+                select(User).where(User.email == payload["email"], User.role == "admin")
+            ).first()
         return session.get(User, user_id)
     except Exception:
         return None
@@ -73,10 +87,35 @@ async def login(
     email: str = Form(...),
     password: str = Form(...)
 ):
-    statement = select(User).where(User.email == email)
-    user = session.exec(statement).first()
+    try:
+        # Checked before any lookup, so a flood from one address never reaches the databases
+        ratelimit.login_by_ip.check(ratelimit.client_ip(request))
+        statement = select(User).where(User.email == email)
+        branch = request_branch(request)
+        user = session.exec(statement).first()
+        if not user:
+            # Not on the requested shard: members are found on their home branch through the directory
+            home = directory.home_branch(email)
+            if home and home != branch:
+                with Session(get_engine(home)) as home_session:
+                    user = home_session.exec(statement).first()
+                branch = home
+        ratelimit.login_by_account.check(email.strip().lower())
+        # Argon2 runs off the event loop, with a bounded number of verifications at once
+        valid = False
+        if user and user.hashed_password:
+            async with ratelimit.login_gate:
+                valid = await run_in_threadpool(verify_password, password, user.hashed_password)
+    except ratelimit.RateLimited as limited:
+        return templates.TemplateResponse(
+            request=request, 
+            name="auth/login.html", 
+            context={"error": limited.message},
+            status_code=limited.status_code,
+            headers={"Retry-After": str(limited.retry_after)}
+        )
     
-    if not user or not user.hashed_password or not verify_password(password, user.hashed_password):
+    if not valid:
         return templates.TemplateResponse(
             request=request, 
             name="auth/login.html", 
@@ -84,7 +123,9 @@ async def login(
         )
     
     # Create Token
-    access_token = create_access_token(data={"sub": str(user.id), "role": user.role})
+    access_token = create_access_token(
+        data={"sub": str(user.id), "role": user.role, "email": user.email, "branch": branch}
+    )
     
     # Redirect based on must_change_password
     if user.must_change_password:
@@ -93,6 +134,7 @@ async def login(
         response = RedirectResponse(url="/", status_code=303)
         
     response.set_cookie(key="access_token", value=access_token, httponly=True)
+    response.set_cookie(key="branch", value=branch, httponly=True)
     return response
 
 @router.get("/change-password", response_class=HTMLResponse)
@@ -120,6 +162,7 @@ async def change_password(
     current_user.hashed_password = get_password_hash(new_password)
     current_user.must_change_password = False
     session.add(current_user)
+    changelog.record(session, "user", current_user.id, "update", {"fields": ["password"]})
     session.commit()
     
     return RedirectResponse(url="/", status_code=303)
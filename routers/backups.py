@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+import asyncio
+import backup
+
+from routers.auth import admin_required
+
+router = APIRouter(prefix="/backups", tags=["backups"])
+
+@router.get("/")
+async def list_backups(current_user: dict = Depends(admin_required)):
+    return JSONResponse(content={"metrics": backup.metrics, "snapshots": backup.snapshots()})
+
+@router.post("/run")
+async def run_backup(current_user: dict = Depends(admin_required)):
+    # The copy runs in small page steps on a worker thread; requests keep being served
+    manifest = await asyncio.to_thread(backup.run_backup)
+    return JSONResponse(content=manifest)
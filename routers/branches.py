@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse, RedirectResponse
+from sqlmodel import Session, select, func
+from database import Branch, fan_out, resolve_branch
+from models import User, Payment
+from datetime import datetime
+import live
+
+from routers.auth import admin_required
+
+router = APIRouter(prefix="/branches", tags=["branches"])
+
+def branch_summary(session: Session, branch: Branch) -> dict:
+    first_day_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    members = session.exec(select(func.count(User.id)).where(User.role == "client")).one() or 0
+    revenue = session.exec(
+        select(func.sum(Payment.amount)).where(Payment.date >= first_day_month)
+    ).one() or 0
+    return {
+        "name": branch.name,
+        "members": members,
+        "monthly_revenue": float(revenue),
+    }
+
+async def all_branches_summary() -> dict:
+    per_branch = await fan_out(branch_summary)
+    # Live counters are only touched on the event loop, so read them here rather than in the threads
+    for slug, summary in per_branch.items():
+        stats = live.counter_for(slug).snapshot()
+        summary["today_attendance"] = stats["today"]
+        summary["occupancy"] = stats["occupancy"]
+    totals = {
+        key: sum(stats[key] for stats in per_branch.values())
+        for key in ("members", "monthly_revenue", "today_attendance", "occupancy")
+    }
+    return {"branches": per_branch, "totals": totals}
+
+@router.get("/")
+async def list_branches(current_user: dict = Depends(admin_required)):
+    return JSONResponse(content=await all_branches_summary())
+
+@router.get("/select/{slug}")
+async def select_branch(slug: str, current_user: dict = Depends(admin_required)):
+    response = RedirectResponse(url="/", status_code=303)
+    response.set_cookie(key="branch", value=resolve_branch(slug), httponly=True)
+    return response
@@ -0,0 +1,91 @@
+from fastapi import APIRouter, Request, Form, Depends
+from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.templating import Jinja2Templates
+from sqlmodel import select
+from sqlalchemy import delete
+from database import SessionDep
+from models import ClassSession, Booking, User
+from datetime import datetime, timedelta
+import assets
+import changelog
+import scheduling
+
+from routers.auth import admin_required
+
+router = APIRouter(prefix="/classes", tags=["classes"])
+templates = Jinja2Templates(directory="templates")
+assets.install(templates)
+templates.env.filters["local"] = scheduling.to_local
+
+SCHEDULE_DAYS = 14
+
+@router.get("/", response_class=HTMLResponse)
+async def list_classes(
+    request: Request,
+    session: SessionDep,
+    current_user: dict = Depends(admin_required)
+):
+    now = datetime.utcnow()
+    classes = session.exec(
+        select(ClassSession)
+        .where(ClassSession.ends_at > now, ClassSession.starts_at <= now + timedelta(days=SCHEDULE_DAYS))
+        .order_by(ClassSession.starts_at)
+    ).all()
+    return templates.TemplateResponse(
+        request=request,
+        name="classes/list.html",
+        context={"classes": classes, "user": current_user}
+    )
+
+@router.post("/new")
+async def create_class(
+    session: SessionDep,
+    name: str = Form(...),
+    starts_at: datetime = Form(...),
+    duration_minutes: int = Form(60),
+    capacity: int = Form(...),
+    instructor: str = Form(None),
+    repeat_weeks: int = Form(1),
+    current_user: dict = Depends(admin_required)
+):
+    scheduling.create_classes(
+        session, name, scheduling.from_local(starts_at), duration_minutes, max(1, capacity),
+        instructor=instructor, repeat_weeks=min(repeat_weeks, 52)
+    )
+    return RedirectResponse(url="/classes", status_code=303)
+
+@router.get("/{class_id}", response_class=HTMLResponse)
+async def class_roster(
+    class_id: int,
+    request: Request,
+    session: SessionDep,
+    current_user: dict = Depends(admin_required)
+):
+    class_session = session.get(ClassSession, class_id)
+    if not class_session:
+        return RedirectResponse(url="/classes", status_code=303)
+    roster = session.exec(
+        select(Booking, User.name)
+        .join(User, User.id == Booking.user_id)
+        .where(Booking.class_id == class_id, Booking.status != "cancelled")
+        .order_by(Booking.status, Booking.created_at, Booking.id)
+    ).all()
+    return templates.TemplateResponse(
+        request=request,
+        name="classes/roster.html",
+        context={"class_session": class_session, "roster": roster, "user": current_user}
+    )
+
+@router.post("/delete/{class_id}")
+async def delete_class(
+    class_id: int,
+    session: SessionDep,
+    current_user: dict = Depends(admin_required)
+):
+    class_session = session.get(ClassSession, class_id)
+    if class_session:
+        session.execute(delete(Booking).where(Booking.class_id == class_id))
+        session.delete(class_session)
+        changelog.record(session, "class", class_id, "delete")
+        session.commit()
+    return RedirectResponse(url="/classes", status_code=303)
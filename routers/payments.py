@@ -1,14 +1,24 @@
 from fastapi import APIRouter, Request, Form, Depends
 from fastapi.responses import RedirectResponse, HTMLResponse
 from fastapi.templating import Jinja2Templates
-from sqlmodel import Session, select
+from sqlmodel import Session, select, func
+from sqlalchemy.exc import IntegrityError
 from database import SessionDep
 from models import Payment, Subscription, Plan, User
 from datetime import datetime, timedelta
 from routers.auth import admin_required
+import activity
+import assets
+import cohorts
+import changelog
+import forecast
+import ledger
+import notifications
+import uuid
 
 router = APIRouter(prefix="/payments", tags=["payments"])
 templates = Jinja2Templates(directory="templates")
+assets.install(templates)
 
 @router.get("/select-plan/{user_id}", response_class=HTMLResponse)
 async def select_plan_page(
@@ -22,7 +32,7 @@ async def select_plan_page(
     return templates.TemplateResponse(
         request=request, 
         name="payments/select_plan.html", 
-        context={"client": user, "plans": plans, "user": current_user}
+        context={"client": user, "plans": plans, "user": current_user, "idempotency_key": str(uuid.uuid4())}
     )
 
 @router.post("/process")
@@ -31,17 +41,37 @@ async def process_payment(
     user_id: int = Form(...),
     plan_id: int = Form(...),
     amount: float = Form(...),
+    idempotency_key: str = Form(None),
     current_user: dict = Depends(admin_required)
 ):
+    # A retried submission (same key) is acknowledged without writing anything again
+    if idempotency_key and session.exec(
+        select(Payment.id).where(Payment.idempotency_key == idempotency_key)
+    ).first():
+        return RedirectResponse(url="/users", status_code=303)
+
     # Get Plan details for duration
     plan = session.get(Plan, plan_id)
     
+    # Renewals extend the current membership instead of overlapping it. Queried before anything
+    # is added, so autoflush can't insert the payment outside the IntegrityError handling below.
+    now = datetime.utcnow()
+    current_end = session.exec(
+        select(func.max(Subscription.end_date)).where(
+            Subscription.user_id == user_id,
+            Subscription.active == True,  # noqa: E712
+            Subscription.end_date > now
+        )
+    ).one()
+    start_date = current_end or now
+
     # Create Payment Record
     payment = Payment(
         user_id=user_id,
         amount=amount,
         method="mock_stripe",
-        status="completed"
+        status="completed",
+        idempotency_key=idempotency_key or None
     )
     session.add(payment)
     
@@ -50,11 +80,31 @@ async def process_payment(
         user_id=user_id,
         plan_id=plan_id,
         active=True,
-        start_date=datetime.utcnow(),
-        end_date=datetime.utcnow() + timedelta(days=plan.duration_days)
+        start_date=start_date,
+        end_date=start_date + timedelta(days=plan.duration_days)
     )
     session.add(sub)
-    
-    session.commit()
+
+    try:
+        session.flush()
+        ledger.post_entry(session, user_id, "charge", plan.price, description=plan.name, payment_id=payment.id)
+        ledger.post_entry(session, user_id, "payment", amount, description=payment.method, payment_id=payment.id)
+        cohorts.record_subscription(session, sub)
+        activity.ensure_member(session, user_id)
+        changelog.record(session, "payment", payment.id, "create", changelog.snapshot(payment, "user_id", "amount", "method", "date"))
+        changelog.record(session, "subscription", sub.id, "create", changelog.snapshot(sub, "user_id", "plan_id", "start_date", "end_date"))
+        notifications.payment_received(session, session.get(User, user_id), payment, sub, plan.name)
+        session.commit()
+    except IntegrityError:
+        # Lost a race against a concurrent retry carrying the same key: that one already won.
+        # Any other constraint failure is a real error and must not look like a saved payment.
+        session.rollback()
+        if not idempotency_key or not session.exec(
+            select(Payment.id).where(Payment.idempotency_key == idempotency_key)
+        ).first():
+            raise
+    else:
+        forecast.invalidate_cache()
+        notifications.wake()
     
     return RedirectResponse(url="/users", status_code=303)
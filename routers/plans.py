@@ -4,12 +4,16 @@ from fastapi.templating import Jinja2Templates
 from sqlmodel import Session, select
 from database import SessionDep
 from models import Plan
+import assets
+import changelog
+import forecast
 
 from routers.auth import get_current_user, admin_required
 from typing import Optional
 
 router = APIRouter(prefix="/plans", tags=["plans"])
 templates = Jinja2Templates(directory="templates")
+assets.install(templates)
 
 @router.get("/", response_class=HTMLResponse)
 async def list_plans(
@@ -46,7 +50,10 @@ async def create_plan(
 ):
     plan = Plan(name=name, price=price, duration_days=duration_days, description=description)
     session.add(plan)
+    session.flush()
+    changelog.record(session, "plan", plan.id, "create", changelog.snapshot(plan, "name", "price", "duration_days", "description"))
     session.commit()
+    forecast.invalidate_cache()
     return RedirectResponse(url="/plans", status_code=303)
 
 @router.post("/delete/{plan_id}")
@@ -58,7 +65,9 @@ async def delete_plan(
     plan = session.get(Plan, plan_id)
     if plan:
         session.delete(plan)
+        changelog.record(session, "plan", plan_id, "delete")
         session.commit()
+        forecast.invalidate_cache()
     return RedirectResponse(url="/plans", status_code=303)
 
 @router.get("/edit/{plan_id}", response_class=HTMLResponse)
@@ -94,5 +103,7 @@ async def update_plan(
         plan.duration_days = duration_days
         plan.description = description
         session.add(plan)
+        changelog.record(session, "plan", plan_id, "update", changelog.snapshot(plan, "name", "price", "duration_days", "description"))
         session.commit()
+        forecast.invalidate_cache()
     return RedirectResponse(url="/plans", status_code=303)
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse, PlainTextResponse
+from models import ProfilerSettings
+import profiler
+
+from routers.auth import admin_required
+
+router = APIRouter(prefix="/profiling", tags=["profiling"])
+
+@router.get("/")
+async def profiling_summary(current_user: dict = Depends(admin_required)):
+    return JSONResponse(content={"settings": profiler.settings, "routes": profiler.summary()})
+
+@router.post("/settings")
+async def update_settings(
+    new_settings: ProfilerSettings,
+    current_user: dict = Depends(admin_required)
+):
+    profiler.settings.update(new_settings.model_dump())
+    return JSONResponse(content=profiler.settings)
+
+@router.get("/folded", response_class=PlainTextResponse)
+async def folded_stacks(route: str, current_user: dict = Depends(admin_required)):
+    # e.g. /profiling/folded?route=GET /users/ | flamegraph.pl > users.svg
+    return profiler.folded(route)
+
+@router.delete("/")
+async def clear_reports(current_user: dict = Depends(admin_required)):
+    profiler.reports.clear()
+    return JSONResponse(content={"status": "ok"})
@@ -1,15 +1,23 @@
-from fastapi import APIRouter, Request, Form, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import APIRouter, Request, Form, Depends, HTTPException
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
-from sqlmodel import Session, select
+from sqlmodel import Session, select, func
+from sqlalchemy import exists, literal, delete, insert, update, select as sa_select
+from sqlalchemy.orm import joinedload
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from database import SessionDep
-from models import Routine, Exercise, User
+from models import Routine, Exercise, User, UserRoutine, Plan, Subscription, BulkAssignment, ExerciseItem
+from datetime import datetime
+from typing import List
+import assets
+import changelog
 
 from routers.auth import get_current_user, admin_required
 from typing import Optional
 
 router = APIRouter(prefix="/routines", tags=["routines"])
 templates = Jinja2Templates(directory="templates")
+assets.install(templates)
 
 @router.get("/", response_class=HTMLResponse)
 async def list_routines(
@@ -18,10 +26,11 @@ async def list_routines(
     current_user: dict = Depends(admin_required)
 ):
     routines = session.exec(select(Routine)).all()
+    plans = session.exec(select(Plan)).all()
     return templates.TemplateResponse(
         request=request, 
         name="routines/list.html", 
-        context={"routines": routines, "user": current_user}
+        context={"routines": routines, "plans": plans, "user": current_user}
     )
 
 @router.get("/user/{user_id}", response_class=HTMLResponse)
@@ -49,6 +58,8 @@ async def create_routine(
 ):
     routine = Routine(name=name, description=description, frequency=frequency)
     session.add(routine)
+    session.flush()
+    changelog.record(session, "routine", routine.id, "create", changelog.snapshot(routine, "name", "description", "frequency"))
     session.commit()
     return RedirectResponse(url="/routines", status_code=303)
 
@@ -59,9 +70,14 @@ async def assign_routine(
     routine_id: int = Form(...),
     current_user: dict = Depends(admin_required)
 ):
-    from models import UserRoutine
-    user_routine = UserRoutine(user_id=user_id, routine_id=routine_id)
-    session.add(user_routine)
+    # Assigning twice is a no-op instead of a composite primary key error
+    result = session.execute(
+        sqlite_insert(UserRoutine.__table__)
+        .values(user_id=user_id, routine_id=routine_id, assigned_at=datetime.utcnow())
+        .on_conflict_do_nothing()
+    )
+    if result.rowcount:
+        changelog.record(session, "routine_assignment", routine_id, "assign", {"user_ids": [user_id]})
     session.commit()
     return RedirectResponse(url=f"/routines/user/{user_id}", status_code=303)
 
@@ -72,13 +88,110 @@ async def unassign_routine(
     routine_id: int = Form(...),
     current_user: dict = Depends(admin_required)
 ):
-    from models import UserRoutine
     user_routine = session.get(UserRoutine, (user_id, routine_id))
     if user_routine:
         session.delete(user_routine)
+        changelog.record(session, "routine_assignment", routine_id, "unassign", {"user_ids": [user_id]})
         session.commit()
     return RedirectResponse(url=f"/routines/user/{user_id}", status_code=303)
 
+def _bulk_targets(criteria: BulkAssignment):
+    # Member ids matching the criteria, as a subquery the database can use set-based
+    now = datetime.utcnow()
+    conditions = [User.role == "client"]
+    if criteria.user_ids is not None:
+        conditions.append(User.id.in_(criteria.user_ids))
+    if criteria.plan_id is not None or criteria.active_only:
+        active = [
+            Subscription.user_id == User.id,
+            Subscription.active == True,  # noqa: E712
+            Subscription.end_date > now,
+        ]
+        if criteria.plan_id is not None:
+            active.append(Subscription.plan_id == criteria.plan_id)
+        conditions.append(exists().where(*active))
+    return select(User.id).where(*conditions)
+
+@router.post("/{routine_id}/bulk-assign")
+async def bulk_assign(
+    routine_id: int,
+    criteria: BulkAssignment,
+    session: SessionDep,
+    current_user: dict = Depends(admin_required)
+):
+    if criteria.action not in ("assign", "unassign"):
+        raise HTTPException(status_code=400, detail="Acción inválida")
+    if criteria.user_ids is None and criteria.plan_id is None and not criteria.active_only:
+        raise HTTPException(status_code=400, detail="Indicá socios, un plan o solo activos")
+    if not session.get(Routine, routine_id):
+        raise HTTPException(status_code=404, detail="Rutina no encontrada")
+
+    targets = _bulk_targets(criteria)
+    matched = session.exec(select(func.count()).select_from(targets.subquery())).one()
+
+    # One statement per action inside a single transaction; existing pairs are skipped
+    if criteria.action == "assign":
+        changed = session.execute(
+            sqlite_insert(UserRoutine.__table__)
+            .from_select(
+                ["user_id", "routine_id", "assigned_at"],
+                targets.add_columns(literal(routine_id), literal(datetime.utcnow())),
+            )
+            .on_conflict_do_nothing()
+            .returning(UserRoutine.user_id)
+        ).scalars().all()
+    else:
+        changed = session.execute(
+            delete(UserRoutine.__table__).where(
+                UserRoutine.routine_id == routine_id,
+                UserRoutine.user_id.in_(targets),
+            )
+            .returning(UserRoutine.user_id)
+        ).scalars().all()
+    if changed:
+        changelog.record(session, "routine_assignment", routine_id, criteria.action, {"user_ids": sorted(changed)})
+    session.commit()
+
+    return JSONResponse(content={
+        "action": criteria.action,
+        "matched": matched,
+        "changed": len(changed),
+        "skipped": matched - len(changed),
+    })
+
+@router.post("/{routine_id}/clone")
+async def clone_routine(
+    routine_id: int,
+    session: SessionDep,
+    name: str = Form(None),
+    current_user: dict = Depends(admin_required)
+):
+    routine = session.get(Routine, routine_id)
+    if not routine:
+        return RedirectResponse(url="/routines", status_code=303)
+
+    copy = Routine(
+        name=name or f"{routine.name} (copia)",
+        description=routine.description,
+        frequency=routine.frequency
+    )
+    session.add(copy)
+    session.flush()
+
+    # Copy every exercise with one INSERT ... SELECT
+    columns = [c for c in Exercise.__table__.columns if c.name not in ("id", "routine_id")]
+    session.execute(
+        insert(Exercise.__table__).from_select(
+            ["routine_id"] + [c.name for c in columns],
+            sa_select(literal(copy.id), *columns).where(Exercise.routine_id == routine_id),
+        )
+    )
+    changelog.record(session, "routine", copy.id, "create", {
+        **changelog.snapshot(copy, "name", "description", "frequency"), "cloned_from": routine_id
+    })
+    session.commit()
+    return RedirectResponse(url=f"/routines/{copy.id}", status_code=303)
+
 @router.get("/{routine_id}", response_class=HTMLResponse)
 async def view_routine(
     routine_id: int, 
@@ -89,30 +202,83 @@ async def view_routine(
     if not current_user:
         return RedirectResponse(url="/auth/login", status_code=303)
 
-    routine = session.get(Routine, routine_id)
-    if not routine:
-        return RedirectResponse(url="/routines", status_code=303)
-    
-    # Check permissions
+    # Check permissions (primary key lookup on the assignment, not a scan of the user's routines)
     is_admin = current_user.role == "admin"
-    is_owner = False
-    
-    # Check if user owns the routine (if not admin)
-    if not is_admin:
-        for r in current_user.routines:
-            if r.id == routine.id:
-                is_owner = True
-                break
-    
-    if not is_admin and not is_owner:
+    if not is_admin and not session.get(UserRoutine, (current_user.id, routine_id)):
         return RedirectResponse(url="/", status_code=303)
 
+    # Routine and its exercises in a single joined query
+    routine = session.exec(
+        select(Routine).where(Routine.id == routine_id).options(joinedload(Routine.exercises))
+    ).unique().first()
+    if not routine:
+        return RedirectResponse(url="/routines", status_code=303)
+
     return templates.TemplateResponse(
         request=request, 
         name="routines/detail.html", 
         context={"routine": routine, "user": current_user}
     )
 
+@router.put("/{routine_id}/exercises")
+async def save_exercises(
+    routine_id: int,
+    items: List[ExerciseItem],
+    session: SessionDep,
+    current_user: dict = Depends(admin_required)
+):
+    if not session.get(Routine, routine_id):
+        raise HTTPException(status_code=404, detail="Rutina no encontrada")
+
+    stored = {
+        exercise.id: exercise
+        for exercise in session.exec(select(Exercise).where(Exercise.routine_id == routine_id)).all()
+    }
+    unknown = [item.id for item in items if item.id is not None and item.id not in stored]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Ejercicios que no pertenecen a la rutina: {unknown}")
+
+    # Diff the submitted order against what is stored; untouched rows are not written
+    fields = ("name", "sets", "reps", "weight", "notes")
+    inserts, updates = [], []
+    for position, item in enumerate(items):
+        values = {field: getattr(item, field) for field in fields}
+        values["position"] = position
+        if item.id is None:
+            inserts.append({"routine_id": routine_id, **values})
+            continue
+        current = stored[item.id]
+        if any(getattr(current, key) != value for key, value in values.items()):
+            updates.append({"id": item.id, **values})
+    kept = {item.id for item in items if item.id is not None}
+    deletes = [exercise_id for exercise_id in stored if exercise_id not in kept]
+
+    # Expire loaded rows so the bulk statements below are not shadowed by the identity map
+    session.expunge_all()
+    if deletes:
+        session.execute(delete(Exercise.__table__).where(Exercise.id.in_(deletes)))
+    if updates:
+        session.execute(update(Exercise), updates)
+    if inserts:
+        session.execute(insert(Exercise.__table__), inserts)
+    if inserts or updates or deletes:
+        changelog.record(session, "routine_exercises", routine_id, "update", {
+            "inserted": len(inserts),
+            "updated": [row["id"] for row in updates],
+            "deleted": deletes,
+        })
+    session.commit()
+
+    exercises = session.exec(
+        select(Exercise).where(Exercise.routine_id == routine_id).order_by(Exercise.position)
+    ).all()
+    return JSONResponse(content={
+        "inserted": len(inserts),
+        "updated": len(updates),
+        "deleted": len(deletes),
+        "exercises": [exercise.model_dump(exclude={"routine_id"}) for exercise in exercises],
+    })
+
 @router.post("/{routine_id}/add-exercise")
 async def add_exercise(
     session: SessionDep,
@@ -124,15 +290,21 @@ async def add_exercise(
     notes: str = Form(None),
     current_user: dict = Depends(admin_required)
 ):
+    last_position = session.exec(
+        select(func.max(Exercise.position)).where(Exercise.routine_id == routine_id)
+    ).one()
     exercise = Exercise(
         routine_id=routine_id,
         name=name,
         sets=sets,
         reps=reps,
         weight=weight,
-        notes=notes
+        notes=notes,
+        position=0 if last_position is None else last_position + 1
     )
     session.add(exercise)
+    session.flush()
+    changelog.record(session, "exercise", exercise.id, "create", changelog.snapshot(exercise, "routine_id", "name", "position"))
     session.commit()
     return RedirectResponse(url=f"/routines/{routine_id}", status_code=303)
 
@@ -145,6 +317,7 @@ async def delete_routine(
     routine = session.get(Routine, routine_id)
     if routine:
         session.delete(routine)
+        changelog.record(session, "routine", routine_id, "delete")
         session.commit()
     return RedirectResponse(url="/routines", status_code=303)
 
@@ -179,5 +352,6 @@ async def update_routine(
         routine.description = description
         routine.frequency = frequency
         session.add(routine)
+        changelog.record(session, "routine", routine_id, "update", changelog.snapshot(routine, "name", "description", "frequency"))
         session.commit()
     return RedirectResponse(url="/routines", status_code=303)
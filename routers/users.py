@@ -1,16 +1,23 @@
-from fastapi import APIRouter, Request, Form, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import APIRouter, Request, Form, Depends, HTTPException
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
 from sqlmodel import Session, select
-from database import SessionDep
+from database import SessionDep, request_branch
 from models import User
+import activity
+import assets
 import uuid
+import changelog
+import credentials
+import directory
+import qrimage
 
 from routers.auth import get_current_user, get_password_hash, admin_required
 from typing import Optional
 
 router = APIRouter(prefix="/users", tags=["users"])
 templates = Jinja2Templates(directory="templates")
+assets.install(templates)
 
 @router.get("/", response_class=HTMLResponse)
 async def list_users(
@@ -39,6 +46,7 @@ async def new_user_form(
 
 @router.post("/new")
 async def create_user(
+    request: Request,
     session: SessionDep,
     name: str = Form(...),
     email: str = Form(...),
@@ -52,11 +60,19 @@ async def create_user(
     
     user = User(name=name, email=email, qr_code_data=qr_code, hashed_password=hashed_pwd, must_change_password=True)
     session.add(user)
+    session.flush()
+    activity.ensure_member(session, user.id)
+    changelog.record(session, "user", user.id, "create", changelog.snapshot(user, "name", "email", "role"))
     session.commit()
     session.refresh(user)
+    directory.register_member(user, request_branch(request))
     return RedirectResponse(url="/users", status_code=303)
 
-from models import User, Routine
+from models import User, Routine, Attendance
+import archive
+import ledger
+
+PROFILE_ATTENDANCE_LIMIT = 50
 
 @router.get("/{user_id}", response_class=HTMLResponse)
 async def user_detail(
@@ -71,10 +87,54 @@ async def user_detail(
         return RedirectResponse(url="/users", status_code=303)
         
     all_routines = session.exec(select(Routine)).all()
+    recent_attendance = session.exec(
+        select(Attendance)
+        .where(Attendance.user_id == user_id)
+        .order_by(Attendance.check_in_time.desc())
+        .limit(PROFILE_ATTENDANCE_LIMIT)
+    ).all()
     
     from datetime import datetime
     return templates.TemplateResponse(
         request=request,
         name="users/profile.html",
-        context={"user": user, "now": datetime.utcnow(), "admin_user": current_user, "all_routines": all_routines}
+        context={
+            "user": user,
+            "now": datetime.utcnow(),
+            "admin_user": current_user,
+            "all_routines": all_routines,
+            "recent_attendance": recent_attendance,
+            "visit_totals": archive.visit_totals(session, user_id),
+            "account": ledger.account(session, user_id)
+        }
+    )
+
+@router.get("/{user_id}/qr.{kind}")
+async def user_qr(
+    request: Request,
+    user_id: int,
+    kind: str,
+    session: SessionDep,
+    v: Optional[str] = None,
+    current_user: Optional[User] = Depends(get_current_user)
+):
+    if not current_user:
+        raise HTTPException(status_code=401, detail="No autenticado")
+    if current_user.role != "admin" and current_user.id != user_id:
+        raise HTTPException(status_code=403, detail="Acceso denegado")
+    if kind not in qrimage.MEDIA_TYPES or not session.get(User, user_id):
+        raise HTTPException(status_code=404, detail="No encontrado")
+
+    credential = credentials.issue_for(session, request_branch(request), user_id)
+    if v != credential["version"]:
+        # Versioned URLs are immutable; anything else is sent to the current one
+        return RedirectResponse(
+            url=f"/users/{user_id}/qr.{kind}?v={credential['version']}",
+            status_code=307,
+            headers={"Cache-Control": "no-store"}
+        )
+    return Response(
+        content=qrimage.render(credential["qr"], kind),
+        media_type=qrimage.MEDIA_TYPES[kind],
+        headers={"Cache-Control": "private, max-age=31536000, immutable"}
     )
@@ -0,0 +1,173 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+from models import Booking, ClassSession, User
+import changelog
+import notifications
+
+# Seat counters are changed with single conditional UPDATEs (booked < capacity), so
+# concurrent bookings serialize on SQLite's write lock and can never overbook a class.
+
+
+class BookingError(Exception):
+    def __init__(self, message: str, status_code: int = 400):
+        self.message = message
+        self.status_code = status_code
+
+
+def _take_seat(session: Session, class_id: int, now: datetime) -> bool:
+    return session.execute(
+        update(ClassSession)
+        .where(
+            ClassSession.id == class_id,
+            ClassSession.booked < ClassSession.capacity,
+            ClassSession.starts_at > now,
+        )
+        .values(booked=ClassSession.booked + 1)
+        .returning(ClassSession.id)
+    ).first() is not None
+
+
+def _adjust(session: Session, class_id: int, **deltas):
+    session.execute(
+        update(ClassSession)
+        .where(ClassSession.id == class_id)
+        .values({name: getattr(ClassSession, name) + delta for name, delta in deltas.items()})
+    )
+
+
+def book(session: Session, class_id: int, user_id: int, now: Optional[datetime] = None) -> dict:
+    # Books a seat, or joins the waitlist when the class is full. Commits.
+    now = now or datetime.utcnow()
+    status = "booked" if _take_seat(session, class_id, now) else "waitlisted"
+    if status == "waitlisted":
+        class_session = session.get(ClassSession, class_id)
+        if not class_session:
+            session.rollback()
+            raise BookingError("Clase no encontrada", 404)
+        if class_session.starts_at <= now:
+            session.rollback()
+            raise BookingError("La clase ya comenzó")
+
+    # A cancelled booking is reused; an active one makes this a no-op (and undoes the seat taken above)
+    inserted = sqlite_insert(Booking.__table__).values(
+        class_id=class_id, user_id=user_id, status=status, created_at=now
+    )
+    booking_id = session.execute(
+        inserted.on_conflict_do_update(
+            index_elements=["class_id", "user_id"],
+            set_={"status": inserted.excluded.status, "created_at": inserted.excluded.created_at},
+            where=Booking.__table__.c.status == "cancelled",
+        ).returning(Booking.__table__.c.id)
+    ).scalar()
+    if booking_id is None:
+        session.rollback()
+        existing = session.exec(
+            select(Booking).where(Booking.class_id == class_id, Booking.user_id == user_id)
+        ).one()
+        return {"booking_id": existing.id, "status": existing.status, "created": False}
+
+    if status == "waitlisted":
+        _adjust(session, class_id, waitlisted=1)
+    changelog.record(session, "booking", booking_id, "create", {"class_id": class_id, "user_id": user_id, "status": status})
+    session.commit()
+    return {"booking_id": booking_id, "status": status, "created": True}
+
+
+def _cancel_if(session: Session, class_id: int, user_id: int, status: str) -> Optional[int]:
+    return session.execute(
+        update(Booking)
+        .where(Booking.class_id == class_id, Booking.user_id == user_id, Booking.status == status)
+        .values(status="cancelled")
+        .returning(Booking.id)
+    ).scalar()
+
+
+def cancel(session: Session, class_id: int, user_id: int) -> dict:
+    # Cancels the member's booking; a freed seat goes to the oldest waitlisted member. Commits.
+    booking_id = _cancel_if(session, class_id, user_id, "booked")
+    was = "booked"
+    if booking_id is None:
+        booking_id = _cancel_if(session, class_id, user_id, "waitlisted")
+        was = "waitlisted"
+    if booking_id is None:
+        session.rollback()
+        raise BookingError("No tenés una reserva en esta clase", 404)
+
+    promoted = None
+    if was == "booked":
+        next_in_line = (
+            select(Booking.id)
+            .where(Booking.class_id == class_id, Booking.status == "waitlisted")
+            .order_by(Booking.created_at, Booking.id)
+            .limit(1)
+            .scalar_subquery()
+        )
+        promoted_booking = session.execute(
+            update(Booking).where(Booking.id == next_in_line).values(status="booked").returning(Booking.id)
+        ).scalar()
+        if promoted_booking is not None:
+            promoted_booking = session.get(Booking, promoted_booking)
+            promoted = promoted_booking.user_id
+    if promoted is not None:
+        # The seat changes hands: booked stays the same, the waitlist shrinks
+        _adjust(session, class_id, waitlisted=-1)
+        notifications.class_promoted(
+            session, session.get(User, promoted), session.get(ClassSession, class_id), promoted_booking
+        )
+    else:
+        _adjust(session, class_id, **{was: -1})
+
+    changelog.record(session, "booking", booking_id, "cancel", {"class_id": class_id, "user_id": user_id, "promoted_user_id": promoted})
+    session.commit()
+    if promoted is not None:
+        notifications.wake()
+    return {"booking_id": booking_id, "cancelled": was, "promoted_user_id": promoted}
+
+
+def from_local(dt: datetime) -> datetime:
+    # Class times are entered as the gym's wall-clock time and stored as naive UTC like every other column
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def to_local(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+
+def create_classes(
+    session: Session, name: str, starts_at: datetime, duration_minutes: int, capacity: int,
+    instructor: Optional[str] = None, repeat_weeks: int = 1
+) -> list:
+    # The same time slot on consecutive weeks
+    created = []
+    for week in range(max(1, repeat_weeks)):
+        start = starts_at + timedelta(weeks=week)
+        class_session = ClassSession(
+            name=name, instructor=instructor, capacity=capacity,
+            starts_at=start, ends_at=start + timedelta(minutes=duration_minutes),
+        )
+        session.add(class_session)
+        session.flush()
+        changelog.record(session, "class", class_session.id, "create",
+                         changelog.snapshot(class_session, "name", "instructor", "starts_at", "ends_at", "capacity"))
+        created.append(class_session)
+    session.commit()
+    return created
+
+
+def upcoming_for_member(session: Session, user_id: int, days: int = 7, now: Optional[datetime] = None) -> list:
+    # (class, the member's booking status or None), soonest first
+    now = now or datetime.utcnow()
+    mine = (
+        select(Booking.class_id, Booking.status)
+        .where(Booking.user_id == user_id, Booking.status != "cancelled")
+        .subquery()
+    )
+    return session.exec(
+        select(ClassSession, mine.c.status)
+        .join(mine, mine.c.class_id == ClassSession.id, isouter=True)
+        .where(ClassSession.starts_at > now, ClassSession.starts_at <= now + timedelta(days=days))
+        .order_by(ClassSession.starts_at)
+    ).all()
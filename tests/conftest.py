@@ -0,0 +1,13 @@
+import os
+import shutil
+import sys
+import tempfile
+
+# Two branches, with every database file created in a scratch directory instead of the repo
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp()
+for name in ("templates", "static"):
+    shutil.copytree(os.path.join(ROOT, name), os.path.join(WORKDIR, name), ignore=shutil.ignore_patterns("dist"))
+os.chdir(WORKDIR)
+os.environ["GYM_BRANCHES"] = "centro:Centro,norte:Norte"
+sys.path.insert(0, ROOT)
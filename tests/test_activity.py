@@ -0,0 +1,43 @@
+from datetime import datetime
+from sqlmodel import Session, select
+from fastapi.testclient import TestClient
+import activity
+import database
+import main
+from models import Plan, User
+
+BRANCH = {"X-Branch": "norte"}
+
+
+def test_members_who_never_checked_in_are_least_active():
+    database.create_db_and_tables()
+    engine = database.engines["norte"]
+    with Session(engine) as session:
+        plan = Plan(name="Mensual Actividad", price=50, duration_days=30)
+        session.add(plan)
+        session.commit()
+        plan_id = plan.id
+
+    with TestClient(main.app) as admin:
+        admin.post("/auth/login", data={"email": "admin@gym.com", "password": "admin123"})
+        members = (("Nunca Vino", "nunca@gym.com"), ("Viene Seguido", "seguido@gym.com"), ("Sin Plan", "sinplan@gym.com"))
+        for name, email in members:
+            admin.post("/users/new", data={"name": name, "email": email, "password": "socio123"}, headers=BRANCH)
+        with Session(engine) as session:
+            ids = {user.email: user.id for user in session.exec(select(User))}
+        for email in ("nunca@gym.com", "seguido@gym.com"):
+            response = admin.post(
+                "/payments/process",
+                data={"user_id": ids[email], "plan_id": plan_id, "amount": 50},
+                headers=BRANCH,
+                follow_redirects=False,
+            )
+            assert response.status_code == 303
+
+    visited_at = datetime.utcnow()
+    with Session(engine) as session:
+        activity.record_visit(session, ids["seguido@gym.com"], visited_at)
+        session.commit()
+        least = [(user.name, last_check_in) for user, last_check_in in activity.least_active(session)]
+
+    assert least == [("Nunca Vino", None), ("Viene Seguido", visited_at)]
@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func, select as sa_select, text
+from sqlmodel import Session, SQLModel, select
+import archive
+import database
+from models import Attendance, User
+
+NOW = datetime(2026, 6, 15)
+OLD = NOW - timedelta(days=365)
+
+
+def test_archived_ids_are_not_reused_after_a_restart(monkeypatch):
+    # A branch created before attendance ids were AUTOINCREMENT
+    branch = database.Branch("legado", "Legado", "gym_legado.db", "gym_legado_archive.db")
+    engine = database._create_branch_engine(branch)
+    monkeypatch.setattr(database, "engines", {branch.slug: engine})
+    monkeypatch.setattr(archive, "engines", {branch.slug: engine})
+    SQLModel.metadata.create_all(engine)
+    archive.archive_metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE attendance"))
+        connection.execute(text(
+            "CREATE TABLE attendance (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL, "
+            "check_in_time DATETIME NOT NULL)"
+        ))
+
+    with Session(engine) as session:
+        user = User(name="Socio Legado", email="legado@gym.com")
+        session.add(user)
+        session.commit()
+        session.add_all([Attendance(user_id=user.id, check_in_time=OLD + timedelta(hours=i)) for i in range(3)])
+        session.commit()
+        user_id = user.id
+    archive.archive_branch(engine, NOW)
+
+    # Without AUTOINCREMENT the emptied hot table hands out id 1 again
+    with Session(engine) as session:
+        reused = Attendance(user_id=user_id, check_in_time=NOW)
+        session.add(reused)
+        session.commit()
+        assert reused.id == 1
+
+    engine.dispose()
+    database.create_db_and_tables()
+    archive.ensure_schema()
+
+    with Session(engine) as session:
+        assert session.exec(select(Attendance.id)).all() == [4]
+        session.add(Attendance(user_id=user_id, check_in_time=NOW + timedelta(hours=1)))
+        session.commit()
+        assert session.exec(select(Attendance.id).order_by(Attendance.id)).all() == [4, 5]
+
+    # Everything moves to the archive without a primary key clash
+    archive.archive_branch(engine, NOW + timedelta(days=400))
+    with Session(engine) as session:
+        archived = session.execute(sa_select(archive.cold_attendance.c.id).order_by(archive.cold_attendance.c.id))
+        assert archived.scalars().all() == [1, 2, 3, 4, 5]
+        assert session.execute(sa_select(func.count()).select_from(archive.hot_attendance)).scalar() == 0
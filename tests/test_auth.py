@@ -0,0 +1,31 @@
+from fastapi.testclient import TestClient
+import main
+
+
+def test_member_logs_in_on_home_branch():
+    with TestClient(main.app) as admin:
+        admin.post("/auth/login", data={"email": "admin@gym.com", "password": "admin123"})
+        response = admin.post(
+            "/users/new",
+            data={"name": "Socia Norte", "email": "norte@gym.com", "password": "norte123"},
+            headers={"X-Branch": "norte"},
+            follow_redirects=False,
+        )
+        assert response.status_code == 303
+
+    with TestClient(main.app) as member:
+        response = member.post(
+            "/auth/login", data={"email": "norte@gym.com", "password": "norte123"}, follow_redirects=False
+        )
+        assert response.status_code == 303
+        assert member.cookies.get("branch") == "norte"
+
+        home = member.get("/", follow_redirects=False)
+        assert home.status_code == 200
+        assert "Socia Norte" in home.text
+
+
+def test_wrong_password_on_home_branch_is_rejected():
+    with TestClient(main.app) as member:
+        response = member.post("/auth/login", data={"email": "norte@gym.com", "password": "incorrecta"})
+        assert "Credenciales inválidas" in response.text
@@ -0,0 +1,53 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import archive
+import backup
+import database
+
+
+def test_concurrent_runs_each_get_a_complete_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmp_path))
+    database.create_db_and_tables()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        manifests = list(pool.map(lambda _: backup.run_backup(), range(4)))
+
+    names = [manifest["name"] for manifest in manifests]
+    assert len(set(names)) == 4
+    assert sorted(manifest["name"] for manifest in backup.snapshots()) == sorted(names)
+    for manifest in manifests:
+        assert manifest["ok"]
+        files = {entry["file"] for entry in manifest["files"]}
+        assert files == {os.path.basename(path) for path in backup.database_files()}
+        assert files <= set(os.listdir(tmp_path / manifest["name"]))
+
+
+def test_snapshot_names_within_one_second_sort_in_creation_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmp_path))
+    database.create_db_and_tables()
+    now = datetime(2026, 5, 1, 3, 0, 0)
+
+    created = [backup.create_snapshot(now)["name"] for _ in range(11)]
+
+    assert created[0] == "20260501-030000"
+    assert created[-1] == "20260501-030000-11"
+    assert [manifest["name"] for manifest in reversed(backup.snapshots())] == created
+
+
+def test_snapshot_waits_for_a_month_being_archived(tmp_path, monkeypatch):
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmp_path))
+    database.create_db_and_tables()
+    finished = threading.Event()
+
+    def snapshot():
+        backup.create_snapshot()
+        finished.set()
+
+    with archive.move_lock:
+        worker = threading.Thread(target=snapshot)
+        worker.start()
+        assert not finished.wait(0.3)
+    worker.join(10)
+    assert finished.is_set()
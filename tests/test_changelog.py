@@ -0,0 +1,58 @@
+import io
+import json
+import pytest
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine
+import changelog
+
+
+def _session() -> Session:
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    return Session(engine)
+
+
+def test_consumer_resumes_after_its_last_committed_batch():
+    with _session() as session:
+        for user_id in range(1, 6):
+            changelog.record(session, "user", user_id, "create")
+        session.commit()
+
+        seen = []
+
+        def fail_on_second_batch(session, events):
+            if seen:
+                raise RuntimeError("handler crashed")
+            seen.extend(event.entity_id for event in events)
+
+        with pytest.raises(RuntimeError):
+            changelog.consume(session, "crm", fail_on_second_batch, batch_size=2)
+        session.rollback()
+        assert changelog.position(session, "crm") == 2
+
+        resumed = []
+        processed = changelog.consume(
+            session, "crm", lambda session, events: resumed.extend(e.entity_id for e in events), batch_size=2
+        )
+        assert processed == 3
+        assert resumed == [3, 4, 5]
+        assert changelog.position(session, "crm") == 5
+
+
+def test_export_writes_only_new_events():
+    with _session() as session:
+        changelog.record(session, "user", 1, "create")
+        changelog.record(session, "payment", 1, "create")
+        session.commit()
+        out = io.StringIO()
+        assert changelog.export(session, "feed", out, "centro", ["payment"]) == 1
+
+        changelog.record(session, "payment", 2, "create")
+        session.commit()
+        assert changelog.export(session, "feed", out, "centro", ["payment"]) == 1
+
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert [(line["branch"], line["entity"], line["entity_id"]) for line in lines] == [
+            ("centro", "payment", 1),
+            ("centro", "payment", 2),
+        ]
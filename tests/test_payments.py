@@ -0,0 +1,50 @@
+import sqlite3
+from sqlalchemy import event
+from sqlmodel import Session, select
+from fastapi.testclient import TestClient
+import database
+import main
+from models import Payment, Plan, Subscription, User
+
+
+def test_concurrent_retry_with_the_same_key_is_acknowledged():
+    database.create_db_and_tables()
+    engine = database.engines[database.DEFAULT_BRANCH]
+    with Session(engine) as session:
+        member = User(name="Socio Pago", email="pago@gym.com")
+        plan = Plan(name="Mensual Test", price=100, duration_days=30)
+        session.add_all([member, plan])
+        session.commit()
+        member_id, plan_id = member.id, plan.id
+
+    # The other request commits the same key after this one has checked for it, before it inserts
+    raced = []
+
+    def other_request_wins(connection, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO payment") and not raced:
+            raced.append(statement)
+            with sqlite3.connect(database.BRANCHES[database.DEFAULT_BRANCH].db_file) as other:
+                other.execute(
+                    "INSERT INTO payment (user_id, amount, date, method, status, idempotency_key) "
+                    "VALUES (?, 100, CURRENT_TIMESTAMP, 'mock_stripe', 'completed', 'clave-repetida')",
+                    (member_id,),
+                )
+
+    with TestClient(main.app) as admin:
+        admin.post("/auth/login", data={"email": "admin@gym.com", "password": "admin123"})
+        event.listen(engine, "before_cursor_execute", other_request_wins)
+        try:
+            response = admin.post(
+                "/payments/process",
+                data={"user_id": member_id, "plan_id": plan_id, "amount": 100, "idempotency_key": "clave-repetida"},
+                follow_redirects=False,
+            )
+        finally:
+            event.remove(engine, "before_cursor_execute", other_request_wins)
+    assert raced
+    assert response.status_code == 303
+
+    with Session(engine) as session:
+        assert len(session.exec(select(Payment).where(Payment.idempotency_key == "clave-repetida")).all()) == 1
+        # The losing request wrote nothing of its own
+        assert session.exec(select(Subscription).where(Subscription.user_id == member_id)).all() == []
@@ -88,19 +88,17 @@ def run_verification():
         return
         
     # Check QR Code
-    # Look for: https://api.qrserver.com/v1/create-qr-code/?size=150x150&data=...
-    match = re.search(r'data=([^"&\s]+)', resp.text)
+    # Look for the locally rendered, signed credential: /users/<id>/qr.svg?v=...
+    match = re.search(r'src="(/users/\d+/qr\.svg\?v=[^"]+)"', resp.text)
     if match:
-        qr_data = match.group(1)
-        print(f"   Found QR Data: {qr_data}")
-        if "@" in qr_data:
-            print("FAILED: QR Code contains email (old behavior)!")
+        qr_url = match.group(1)
+        print(f"   Found QR image: {qr_url}")
+        if "api.qrserver.com" in resp.text:
+            print("FAILED: Dashboard still loads the QR from api.qrserver.com!")
+        elif user_client.get(qr_url).headers.get("content-type", "").startswith("image/svg+xml"):
+            print("SUCCESS: QR Code is rendered by the server.")
         else:
-            try:
-                uuid_obj = uuid.UUID(qr_data)
-                print("SUCCESS: QR Code contains a valid UUID.")
-            except ValueError:
-                print(f"WARNING: QR Code data '{qr_data}' is not a UUID, but does not look like an email.")
+            print("FAILED: QR image endpoint did not return an SVG.")
     else:
         print("FAILED: Could not find QR code image in dashboard.")
 